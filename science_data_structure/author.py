@@ -43,7 +43,7 @@ class Author(JSONObject):
 
     @property
     def created_on(self):
-        return self._create_on
+        return self._created_on
 
     @staticmethod
     def create_author(name: str) -> "Author":
@@ -55,7 +55,7 @@ class Author(JSONObject):
     def from_dict(content):
         author_id = int(content["id"])
         name = content["name"]
-        created_on = datetime.strptime(content["created_on"], "%Y-%M-%d")
+        created_on = datetime.strptime(content["created_on"], "%Y-%m-%d")
 
         return Author(author_id,
                       name,
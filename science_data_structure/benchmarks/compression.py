@@ -0,0 +1,63 @@
+"""
+Benchmark of the compressed leaf formats against plain .npy files. Reports
+the write and read throughput and the compression ratio on sparse sensor
+like data. Run from the package folder:
+
+    python -m benchmarks.compression --size 64
+"""
+import click
+import numpy
+import tempfile
+import time
+from pathlib import Path
+from author import Author
+from structures import StructuredDataSet
+from data_formats import compressed_formats
+
+
+def sensor_data(size: int) -> numpy.ndarray:
+    """
+    Mostly zeros with bursts of noise, size in MB
+    """
+    n_rows = size * 2 ** 20 // (16 * 2)
+    data = numpy.zeros((n_rows, 16), dtype=numpy.int16)
+    bursts = numpy.random.random(n_rows) < 0.05
+    data[bursts] = numpy.random.normal(0, 300, (bursts.sum(), 16)).astype(numpy.int16)
+    return data
+
+
+@click.command()
+@click.option("--size", default=64, help="size of the array in MB")
+@click.option("--repeat", default=3, help="number of writes and reads per format")
+def main(size, repeat):
+    data = sensor_data(size)
+    formats = ["npy"] + list(compressed_formats.available_formats.keys())
+
+    click.echo("{:>6s} {:>12s} {:>12s} {:>8s}".format("format", "write MB/s", "read MB/s", "ratio"))
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = StructuredDataSet.create_dataset(Path(directory),
+                                                   "benchmark",
+                                                   Author.create_author("Benchmark"))
+        for leaf_format in formats:
+            leaf = dataset.add_leaf(leaf_format, data, leaf_format=leaf_format)
+            write_time = read_time = float("inf")
+            for _ in range(repeat):
+                leaf.set_dirty()
+                start = time.perf_counter()
+                dataset.write()
+                write_time = min(write_time, time.perf_counter() - start)
+
+                dataset_read = StructuredDataSet.open_dataset(dataset.path, lazy=True)
+                start = time.perf_counter()
+                dataset_read[leaf_format].data
+                read_time = min(read_time, time.perf_counter() - start)
+
+            stored = sum(child.stat().st_size for child in leaf.path.iterdir())
+            click.echo("{:>6s} {:12.1f} {:12.1f} {:8.2f}".format(leaf_format,
+                                                                 size / write_time,
+                                                                 size / read_time,
+                                                                 data.nbytes / stored))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark of the write throughput of a data-set for a growing number of
+worker threads. Run from the package folder:
+
+    python -m benchmarks.parallel_write --leafs 64 --size 8
+"""
+import click
+import numpy
+import tempfile
+import time
+from pathlib import Path
+from author import Author
+from structures import StructuredDataSet
+
+
+def create_dataset(path: Path,
+                   n_leafs: int,
+                   size: int) -> StructuredDataSet:
+    dataset = StructuredDataSet.create_dataset(path,
+                                               "benchmark",
+                                               Author.create_author("Benchmark"))
+    n_values = size * 2 ** 20 // 8
+    for i_leaf in range(n_leafs):
+        dataset["branch_{:d}".format(i_leaf % 8)]["leaf_{:d}".format(i_leaf)] = numpy.random.random(n_values)
+    return dataset
+
+
+def time_write(dataset: StructuredDataSet,
+               workers: int) -> float:
+    # mark everything as changed so every leaf is written again
+    for branch in dataset.branches:
+        for leaf in branch.leafs:
+            leaf.set_dirty()
+    start = time.perf_counter()
+    dataset.write(workers=workers)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--leafs", default=64, help="number of leafs in the data-set")
+@click.option("--size", default=8, help="size of a single leaf in MB")
+@click.option("--workers", default="1,2,4,8", help="comma separated numbers of workers")
+@click.option("--repeat", default=3, help="number of writes per number of workers")
+def main(leafs, size, workers, repeat):
+    total = leafs * size
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = create_dataset(Path(directory), leafs, size)
+        dataset.write()
+
+        click.echo("{:>8s} {:>10s} {:>10s}".format("workers", "time [s]", "MB/s"))
+        for n_workers in map(int, workers.split(",")):
+            duration = min(time_write(dataset, n_workers) for _ in range(repeat))
+            click.echo("{:8d} {:10.3f} {:10.1f}".format(n_workers, duration, total / duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark suite of the main operations on a data-set: creating the tree,
+writing it, opening it, reading the data of the leafs and removing it. Every
+operation is timed on a number of tree shapes, from deep trees of tiny leafs
+to a few huge arrays. Reports the wall time, the throughput, the number of
+read and write system calls and the peak memory of every phase. Every shape
+is run once untimed to warm up, the peak memory is measured in a separate
+run, as tracing the allocations slows down the timed runs. Run from the
+package folder:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare results.json
+"""
+import click
+import json
+import numpy
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+from author import Author
+from structures import Branch, StructuredDataSet
+
+# name: (depth, branches per level, leafs per branch, values per leaf)
+shapes = {
+    "deep": (8, 2, 1, 16),
+    "wide": (1, 1, 4096, 16),
+    "tiny_leafs": (2, 16, 32, 16),
+    "huge_arrays": (1, 1, 4, 2 ** 23),
+}
+phases = ["create", "write", "open", "read", "remove"]
+
+
+def system_calls() -> Dict[str, int]:
+    """
+    Read and write system calls of the process so far, only available on linux
+    """
+    try:
+        with open("/proc/self/io") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+    except (FileNotFoundError, PermissionError):
+        return {"syscr": 0, "syscw": 0}
+    return {"syscr": int(counters["syscr"]), "syscw": int(counters["syscw"])}
+
+
+def build_tree(branch: Branch,
+               depth: int,
+               n_branches: int,
+               n_leafs: int,
+               n_values: int) -> None:
+    for i_leaf in range(n_leafs):
+        branch["leaf_{:d}".format(i_leaf)] = numpy.random.random(n_values)
+    if depth > 1:
+        for i_branch in range(n_branches):
+            build_tree(branch["branch_{:d}".format(i_branch)], depth - 1, n_branches, n_leafs, n_values)
+
+
+def read_leafs(branch: Branch) -> int:
+    n_bytes = 0
+    for leaf in branch.leafs:
+        n_bytes += leaf.data.nbytes
+    for child in branch.branches:
+        n_bytes += read_leafs(child)
+    return n_bytes
+
+
+def run_shape(path: Path,
+              shape: tuple,
+              workers: int,
+              trace_memory: bool = False) -> Dict[str, Dict]:
+    """
+    Time all the phases on a single tree shape, with trace_memory the peak
+    memory of every phase is traced as well
+    """
+    results = {}
+    state = {}
+
+    def create():
+        dataset = StructuredDataSet.create_dataset(path, "benchmark", Author.create_author("Benchmark"))
+        build_tree(dataset, *shape)
+        state["dataset"] = dataset
+        return 0
+
+    def write():
+        state["dataset"].write(workers=workers)
+        return state["dataset"].size
+
+    def open_dataset():
+        state["dataset"] = StructuredDataSet.open_dataset(state["dataset"].path, workers=workers)
+        return 0
+
+    def read():
+        return read_leafs(state["dataset"])
+
+    def remove():
+        state["dataset"].remove()
+        return 0
+
+    for name, phase in zip(phases, [create, write, open_dataset, read, remove]):
+        calls = system_calls()
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        n_bytes = phase()
+        duration = time.perf_counter() - start
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        calls_after = system_calls()
+        results[name] = {
+            "time": duration,
+            "bytes": n_bytes,
+            "bytes_per_second": n_bytes / duration if duration > 0 else 0.0,
+            "read_calls": calls_after["syscr"] - calls["syscr"],
+            "write_calls": calls_after["syscw"] - calls["syscw"],
+            "peak_memory": peak,
+        }
+    return results
+
+
+def run(shape_names: List[str],
+        repeat: int,
+        workers: int) -> Dict[str, Dict]:
+    """
+    The fastest run of every phase on every shape, after a warm-up run. The
+    peak memory comes from an extra run with traced allocations
+    """
+    results = {}
+    for shape_name in shape_names:
+        with tempfile.TemporaryDirectory() as directory:
+            run_shape(Path(directory), shapes[shape_name], workers)
+        best = None
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                timings = run_shape(Path(directory), shapes[shape_name], workers)
+            if best is None:
+                best = timings
+            else:
+                for phase in phases:
+                    if timings[phase]["time"] < best[phase]["time"]:
+                        best[phase] = timings[phase]
+        with tempfile.TemporaryDirectory() as directory:
+            traced = run_shape(Path(directory), shapes[shape_name], workers, trace_memory=True)
+        for phase in phases:
+            best[phase]["peak_memory"] = traced[phase]["peak_memory"]
+        results[shape_name] = best
+    return results
+
+
+def environment(workers: int, repeat: int) -> Dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "workers": workers,
+        "repeat": repeat,
+    }
+
+
+@click.command()
+@click.option("--shapes", "shape_names", default=",".join(shapes.keys()), help="comma separated tree shapes")
+@click.option("--repeat", default=3, help="number of timed runs per shape, the fastest run is reported")
+@click.option("--workers", default=None, type=int, help="number of threads writing and reading")
+@click.option("--output", default=None, type=click.Path(), help="write the results to a json file")
+@click.option("--compare", default=None, type=click.Path(exists=True), help="json file of an earlier run")
+def main(shape_names, repeat, workers, output, compare):
+    results = run(shape_names.split(","), repeat, workers)
+    baseline = None if compare is None else json.loads(Path(compare).read_text())["results"]
+
+    click.echo("{:>12s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "shape", "phase", "time [s]", "MB/s", "reads", "writes", "peak MB"))
+    for shape_name, timings in results.items():
+        for phase in phases:
+            timing = timings[phase]
+            line = "{:>12s} {:>8s} {:10.4f} {:10.1f} {:10d} {:10d} {:10.1f}".format(
+                shape_name, phase, timing["time"], timing["bytes_per_second"] / 2 ** 20,
+                timing["read_calls"], timing["write_calls"], timing["peak_memory"] / 2 ** 20)
+            if baseline is not None and shape_name in baseline:
+                line += " {:+7.1f}%".format(100 * (timing["time"] / baseline[shape_name][phase]["time"] - 1))
+            click.echo(line)
+
+    if output is not None:
+        Path(output).write_text(json.dumps({"environment": environment(workers, repeat),
+                                            "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
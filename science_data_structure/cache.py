@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+
+class LeafCache:
+    """
+    Keeps track of the data loaded by the leafs of a data-set. Once the
+    loaded data exceeds the budget in bytes, the data of the least recently
+    used leafs is unloaded. Only leafs whose data is on disk are unloaded,
+    they read their data again on the next access
+    """
+
+    def __init__(self,
+                 budget: int) -> None:
+        self._budget = budget
+        self._leafs = OrderedDict()  # type: OrderedDict
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        line = "size \t\t {:d} / {:d} \n".format(self._size, self._budget)
+        line += "leafs \t\t {:d} \n".format(len(self._leafs))
+        line += "hits \t\t {:d} \n".format(self._hits)
+        line += "misses \t\t {:d} \n".format(self._misses)
+        line += "evictions \t {:d}".format(self._evictions)
+        return line
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget: int) -> None:
+        with self._lock:
+            self._budget = budget
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes of data loaded by the leafs in the cache
+        """
+        return self._size
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        return self._evictions
+
+    def hit(self, leaf) -> None:
+        """
+        The data of the leaf is accessed while it is loaded
+        """
+        with self._lock:
+            self._hits += 1
+            if leaf in self._leafs:
+                self._leafs.move_to_end(leaf)
+
+    def add(self, leaf, n_bytes: int, loaded: bool = True) -> None:
+        """
+        The leaf holds n_bytes of data, loaded from disk or assigned
+        """
+        with self._lock:
+            if loaded:
+                self._misses += 1
+            self._size += n_bytes - self._leafs.pop(leaf, 0)
+            self._leafs[leaf] = n_bytes
+            self._evict(leaf)
+
+    def discard(self, leaf) -> None:
+        with self._lock:
+            self._size -= self._leafs.pop(leaf, 0)
+
+    def clear(self) -> None:
+        """
+        Unload all the leafs that can be unloaded
+        """
+        budget = self._budget
+        self.budget = 0
+        self.budget = budget
+
+    # protected functions
+    def _evict(self, keep=None) -> None:
+        if self._size <= self._budget:
+            return
+        for leaf in list(self._leafs.keys()):
+            if self._size <= self._budget:
+                break
+            # leafs with changes can not be read again from disk
+            if leaf is keep or leaf.is_dirty:
+                continue
+            self._size -= self._leafs.pop(leaf)
+            self._evictions += 1
+            leaf._unload()
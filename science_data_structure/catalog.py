@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Tuple
+
+
+class Catalog:
+    """
+    Index of all the nodes of a data-set in a sqlite database at the root of
+    the data-set. Opening, listing and finding nodes are queries on the
+    index instead of walks through the directory tree. The index is kept in
+    sync by StructuredDataSet.write, after editing the tree by hand it has
+    to be rebuilt
+    """
+
+    file_name = ".catalog.sqlite"
+
+    def __init__(self,
+                 path: Path) -> None:
+        self._path = path
+        # the tree can be read by a pool of threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS nodes ("
+                                 "path TEXT PRIMARY KEY, "
+                                 "parent TEXT NOT NULL, "
+                                 "name TEXT NOT NULL, "
+                                 "kind TEXT NOT NULL, "
+                                 "branch_id INTEGER, "
+                                 "leaf_format TEXT, "
+                                 "dtype TEXT, "
+                                 "shape TEXT, "
+                                 "size INTEGER)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent)")
+        self._connection.commit()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def children(self, parent: str) -> List[Tuple[str, str]]:
+        """
+        Names and kinds ("branch" or "leaf") of the children of a node, the
+        root of the data-set is ""
+        """
+        with self._lock:
+            return self._connection.execute("SELECT name, kind FROM nodes WHERE parent = ?",
+                                            (parent, )).fetchall()
+
+    def find(self,
+             pattern: str = None,
+             kind: str = None,
+             leaf_format: str = None,
+             dtype: str = None) -> List[str]:
+        """
+        Paths of the nodes matching the glob pattern and the other
+        properties, relative to the root of the data-set
+        """
+        conditions = []
+        parameters = []
+        for column, value in [("path", pattern), ("kind", kind), ("leaf_format", leaf_format), ("dtype", dtype)]:
+            if value is not None:
+                conditions += ["{:s} {:s} ?".format(column, "GLOB" if column == "path" else "=")]
+                parameters += [value]
+        query = "SELECT path FROM nodes"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query + " ORDER BY path", parameters)]
+
+    def record(self, relative_path: str) -> dict:
+        """
+        All the columns of a single node
+        """
+        with self._lock:
+            cursor = self._connection.execute("SELECT * FROM nodes WHERE path = ?", (relative_path, ))
+            row = cursor.fetchone()
+            if row is None:
+                raise KeyError(relative_path)
+            record = dict(zip([column[0] for column in cursor.description], row))
+        if record["shape"] is not None:
+            record["shape"] = tuple(json.loads(record["shape"]))
+        return record
+
+    def update(self,
+               dataset,
+               written: list,
+               removed: List[Path]) -> None:
+        """
+        Bring the catalog up to date after a write of the data-set
+        """
+        root = dataset.path
+        with self._lock:
+            for path in removed:
+                relative_path = path.relative_to(root).as_posix()
+                self._connection.execute("DELETE FROM nodes WHERE path = ? OR substr(path, 1, ?) = ?",
+                                         (relative_path, len(relative_path) + 1, relative_path + "/"))
+            self._connection.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                         [self._row(root, node) for node in written if node is not dataset])
+            self._connection.commit()
+
+    def rebuild(self, dataset) -> None:
+        """
+        Index the complete tree of the data-set again
+        """
+        nodes = [node for path, node in dataset.walk()]
+        with self._lock:
+            self._connection.execute("DELETE FROM nodes")
+        self.update(dataset, nodes, [])
+
+    # protected functions
+    @staticmethod
+    def _row(root: Path, node) -> tuple:
+        from structures import Leaf
+        path = node.path.relative_to(root)
+        parent = path.parent.as_posix()
+        if parent == ".":
+            parent = ""
+        if isinstance(node, Leaf):
+            shape = node.shape
+            return (path.as_posix(), parent, path.name, "leaf", node.meta.branch_id, node.extension,
+                    None if node.dtype is None else str(node.dtype),
+                    None if shape is None else json.dumps(list(shape)),
+                    node.file_size)
+        return (path.as_posix(), parent, path.name, "branch", node.meta.branch_id, None, None, None, None)
@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+from core import to_dict
+from meta import Meta
+
+
+class ConsolidatedMeta:
+    """
+    All the metas of a data-set gathered in a single file at the root of the
+    data-set. Opening a consolidated data-set reads that one file instead of
+    a meta per node, the metas of the nodes are kept for browsing the
+    data-set by hand. Any write of the data-set removes the file, after
+    changing the data-set it has to be consolidated again
+    """
+
+    file_name = ".consolidated.json"
+
+    @staticmethod
+    def write(dataset) -> Path:
+        """
+        Gather the metas of the complete tree, the nodes are stored parents first
+        """
+        from structures import Leaf
+        root = dataset.path
+        nodes = []
+        branches = [dataset]
+        while len(branches) > 0:
+            branch = branches.pop(0)
+            branch._load_all()
+            for node in branch._content.values():
+                if isinstance(node, Leaf):
+                    nodes += [[node.path.relative_to(root).as_posix(), node.extension, node.meta]]
+                else:
+                    nodes += [[node.path.relative_to(root).as_posix(), None, node.meta]]
+                    branches += [node]
+
+        path = root / ConsolidatedMeta.file_name
+        path.write_text(json.dumps({"meta": dataset.meta, "compact": dataset.meta.compact, "nodes": nodes},
+                                   default=to_dict,
+                                   separators=(",", ":")))
+        return path
+
+    @staticmethod
+    def read(path: Path):
+        """
+        Open the data-set at path from its consolidated metas
+        """
+        from structures import Branch, StructuredDataSet
+        import data_formats
+        content = json.loads((path / ConsolidatedMeta.file_name).read_text())
+        top_level_meta = Meta.from_dict(content["meta"], path / ".meta.json")
+        top_level_meta._compact = content["compact"]
+        dataset = StructuredDataSet(path.parent,
+                                    path.stem,
+                                    {},
+                                    top_level_meta)
+        root = dataset.path
+
+        branches = {".": dataset}
+        for relative_path, extension, meta_content in content["nodes"]:
+            relative_path = Path(relative_path)
+            parent = branches[relative_path.parent.as_posix()]
+            meta = Meta.from_dict(meta_content, root / relative_path / ".meta.json", top_level_meta)
+            if extension is None:
+                node = Branch(parent, relative_path.name, {}, meta)
+                node._dirty = False
+                branches[relative_path.as_posix()] = node
+                parent._content[relative_path.name] = node
+            else:
+                node = data_formats.available_extensions[extension](parent, relative_path.name, meta)
+                node._opened()
+                parent._content[relative_path.name[:-5]] = node
+        for branch in branches.values():
+            branch._is_listed = True
+            branch._dirty = False
+        return dataset
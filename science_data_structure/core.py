@@ -2,17 +2,39 @@ import json
 from typing import Dict
 
 
+def to_dict(json_object: "JSONObject") -> Dict:
+    return json_object.__dict__()
+
+
 class JSONObject:
 
-    def to_json(self) -> str:
-        return json.dumps(self, default=lambda o: o.__dict__(),
+    def to_json(self, compact: bool = False) -> str:
+        """
+        The object as json, readable by default. Compact json leaves out all
+        the whitespace
+        """
+        if compact:
+            return json.dumps(self, default=to_dict,
+                              separators=(",", ":"))
+        return json.dumps(self, default=to_dict,
                           sort_keys=True,
                           indent=4)
 
+    # the subclasses define __dict__ as the content to serialize, which hides
+    # the attributes of the object from pickle
+    def __getstate__(self) -> Dict:
+        return dict(_attributes.__get__(self))
+
+    def __setstate__(self, state: Dict) -> None:
+        _attributes.__get__(self).update(state)
+
     @staticmethod
     def dict_from_json(text: str) -> Dict:
         return json.loads(text)
 
+
+_attributes = vars(JSONObject)["__dict__"]
+
 class Singleton(type):
 
     _instances = {}
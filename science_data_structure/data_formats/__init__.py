@@ -1,13 +1,26 @@
 from data_formats import general_formats
+from data_formats import compressed_formats
+from data_formats import packed_formats
+from data_formats import frame_formats
+from data_formats import text_formats
 import numpy
 
 available_types = {
-    numpy.ndarray: general_formats.LeafNumpy 
+    numpy.ndarray: general_formats.LeafNumpy,
+    numpy.memmap: general_formats.LeafNumpy,
+    **frame_formats.available_types,
 }
 
 
 available_extensions = {
     "npy": general_formats.LeafNumpy,
+    "npa": general_formats.LeafNumpyAppend,
+    "zlib": compressed_formats.LeafZlib,
+    "lzma": compressed_formats.LeafLzma,
+    "bz2": compressed_formats.LeafBz2,
+    "packed": packed_formats.LeafPacked,
+    "frame": frame_formats.LeafDataFrame,
+    "dlm": text_formats.LeafDelimited,
 }
 
 
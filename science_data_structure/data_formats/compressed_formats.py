@@ -0,0 +1,246 @@
+import ast
+import bz2
+import json
+import lzma
+import os
+import struct
+import zlib
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from structures import Leaf, Node
+import logger
+from meta import Meta
+
+
+class LeafCompressed(Leaf):
+    """
+    Leaf storing a numpy array compressed in chunks of rows. The file holds
+    the compressed chunks followed by an index with the dtype, the shape and
+    the position of every chunk, and the length of that index. Chunks are
+    compressed in parallel and a region of rows only decompresses the
+    chunks it touches
+    """
+
+    chunk_size = 2 ** 22  # uncompressed bytes per chunk
+    workers = os.cpu_count()
+
+    def __init__(self,
+                 parent: Node,
+                 name: str,
+                 meta: Meta) -> None:
+        super().__init__(parent,
+                         name,
+                         meta)
+        self._data = None  # type: numpy.ndarray
+        self._index = None  # type: Dict
+        self._is_read = False
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        if self._is_read:
+            return self._data.dtype
+        return self._dtype()
+
+    @property
+    def shape(self) -> tuple:
+        if self._is_read:
+            return self._data.shape
+        return tuple(self._read_index()["shape"])
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        raise NotImplementedError("Must override the compress function")
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        raise NotImplementedError("Must override the decompress function")
+
+    @logger.instrument("read", logger.read_bytes)
+    def read(self) -> None:
+        index = self._read_index()
+        shape = tuple(index["shape"])
+        n_rows = shape[0] if len(shape) > 0 else 1
+        self._data = self._read_rows(0, n_rows).reshape(shape)
+        self._is_read = True
+
+    def remove(self) -> None:
+        self.file_path.unlink()
+        self.meta.path.unlink()
+        self.path.rmdir()
+
+    def __getitem__(self, key) -> numpy.ndarray:
+        """
+        Read a region of the data, only the chunks holding the requested
+        rows are decompressed
+        """
+        if self._is_read:
+            return self._data[key]
+        shape = tuple(self._read_index()["shape"])
+        first = key[0] if isinstance(key, tuple) else key
+        rest = key[1:] if isinstance(key, tuple) else ()
+        if len(shape) == 0 or not isinstance(first, (int, numpy.integer, slice)):
+            return self.data[key]
+
+        if isinstance(first, slice):
+            start, stop, step = first.indices(shape[0])
+            rows = range(start, stop, step)
+            if len(rows) == 0:
+                return numpy.empty((0, ) + shape[1:], dtype=self._dtype())[(slice(None), ) + rest]
+            low = min(rows[0], rows[-1])
+            block = self._read_rows(low, max(rows[0], rows[-1]) + 1)
+            local = slice(rows[0] - low, None, step) if step > 0 else numpy.arange(start, stop, step) - low
+            return block[(local, ) + rest]
+
+        row = int(first) + shape[0] if first < 0 else int(first)
+        if row < 0 or row >= shape[0]:
+            raise IndexError("index {:d} is out of bounds for axis 0 with size {:d}".format(int(first), shape[0]))
+        return self._read_rows(row, row + 1)[(0, ) + rest]
+
+    # protected functions
+    def _get_data(self) -> numpy.ndarray:
+        cache = self.dataset.cache
+        if not self._is_read:
+            self.read()
+            if cache is not None:
+                cache.add(self, self._data.nbytes)
+        elif cache is not None:
+            cache.hit(self)
+        return self._data
+
+    def _set_data(self, data: numpy.ndarray) -> None:
+        self._data = data
+        self._is_read = True
+        cache = self.dataset.cache
+        if cache is not None:
+            cache.add(self, data.nbytes, loaded=False)
+
+    def _unload(self) -> None:
+        self._data = None
+        self._is_read = False
+
+    def _dtype(self) -> numpy.dtype:
+        return numpy.lib.format.descr_to_dtype(ast.literal_eval(self._read_index()["descr"]))
+
+    def _read_index(self) -> Dict:
+        if self._index is None:
+            with self.file_path.open("rb") as compressed_file:
+                compressed_file.seek(-8, os.SEEK_END)
+                length = struct.unpack("<Q", compressed_file.read(8))[0]
+                compressed_file.seek(-8 - length, os.SEEK_END)
+                self._index = json.loads(compressed_file.read(length).decode("utf-8"))
+        return self._index
+
+    def _read_rows(self, start: int, stop: int) -> numpy.ndarray:
+        """
+        Decompress the rows from start up to stop
+        """
+        index = self._read_index()
+        shape = tuple(index["shape"])
+        dtype = self._dtype()
+        chunk_rows = index["chunk_rows"]
+        first_chunk = start // chunk_rows
+        last_chunk = (stop - 1) // chunk_rows
+
+        with self.file_path.open("rb") as compressed_file:
+            compressed = []  # type: List[bytes]
+            for offset, length in index["chunks"][first_chunk:last_chunk + 1]:
+                compressed_file.seek(offset)
+                compressed += [compressed_file.read(length)]
+        chunks = self._map(self.decompress, compressed)
+
+        rows = numpy.frombuffer(b"".join(chunks), dtype=dtype)
+        rows = rows.reshape((-1, ) + shape[1:])
+        offset = first_chunk * chunk_rows
+        return rows[start - offset:stop - offset]
+
+    def _map(self, function, items: List[bytes]) -> List[bytes]:
+        if len(items) > 1 and self.workers > 1:
+            # the codecs release the GIL while (de)compressing
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return list(executor.map(function, items))
+        return list(map(function, items))
+
+    @logger.instrument("write", logger.written_bytes)
+    def _write_child(self, path) -> None:
+        if not self._is_read:
+            # the data on disk is unchanged
+            return
+        data = numpy.ascontiguousarray(self._data)
+        if data.dtype.hasobject:
+            raise TypeError("Arrays of python objects can not be compressed")
+        n_rows = data.shape[0] if data.ndim > 0 else 1
+        row_bytes = data.nbytes // n_rows if n_rows > 0 else data.itemsize
+        chunk_rows = max(1, self.chunk_size // max(1, row_bytes))
+
+        raw = memoryview(data.reshape(-1)).cast("B")
+        chunks = [raw[start * row_bytes:(start + chunk_rows) * row_bytes] for start in range(0, n_rows, chunk_rows)]
+        compressed = self._map(self.compress, chunks)
+
+        index = {
+            "descr": repr(numpy.lib.format.dtype_to_descr(data.dtype)),
+            "shape": list(data.shape),
+            "chunk_rows": chunk_rows,
+            "chunks": []
+        }
+        offset = 0
+        for chunk in compressed:
+            index["chunks"] += [[offset, len(chunk)]]
+            offset += len(chunk)
+        index_bytes = json.dumps(index).encode("utf-8")
+
+        with path.open("wb") as compressed_file:
+            for chunk in compressed:
+                compressed_file.write(chunk)
+            compressed_file.write(index_bytes)
+            compressed_file.write(struct.pack("<Q", len(index_bytes)))
+        self._index = index
+
+
+class LeafZlib(LeafCompressed):
+
+    extension = "zlib"
+    level = 6
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return zlib.compress(data, LeafZlib.level)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class LeafLzma(LeafCompressed):
+
+    extension = "lzma"
+    preset = 1
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return lzma.compress(data, preset=LeafLzma.preset)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+class LeafBz2(LeafCompressed):
+
+    extension = "bz2"
+    level = 9
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return bz2.compress(data, LeafBz2.level)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return bz2.decompress(data)
+
+
+available_formats = {
+    "zlib": LeafZlib,
+    "lzma": LeafLzma,
+    "bz2": LeafBz2,
+}
@@ -0,0 +1,327 @@
+import json
+import os
+import re
+import shutil
+import numpy
+from pathlib import Path
+from typing import Dict, List
+from structures import Leaf, Node
+import logger
+from meta import Meta
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+def require_pandas() -> None:
+    if pandas is None:
+        raise ImportError("DataFrame leafs need pandas, install it with pip install pandas")
+
+
+class LeafDataFrame(Leaf):
+    """
+    Leaf storing a pandas DataFrame column by column. Every column, and the
+    index, is stored in .npy chunks, hidden files in the folder of the leaf.
+    The data.frame file describes the table: the number of rows and the
+    name, dtype and chunks of the index and of every column. Reading a few
+    columns only touches their chunks, which are memory-mapped with the
+    mmap mode of the data-set. Appended rows are written as new chunks and
+    replacing a column only writes that column
+    """
+
+    extension = "frame"
+    chunk_name = re.compile(r"^\.c\d+\.npy$")
+
+    def __init__(self,
+                 parent: Node,
+                 name: str,
+                 meta: Meta) -> None:
+        super().__init__(parent,
+                         name,
+                         meta)
+        self._frame = None  # type: pandas.DataFrame
+        self._is_read = False
+        # description of the table, None until it is read from disk
+        self._table = LeafDataFrame._empty_table()  # type: Dict
+        # chunks that are not written yet
+        self._pending = {}  # type: Dict[str, numpy.ndarray]
+        self._targets = []  # type: List[tuple]
+        # chunks in the table on disk
+        self._stored = set()  # type: set
+
+    @property
+    def table(self) -> Dict:
+        if self._table is None:
+            self._table = json.loads(self.file_path.read_text())
+            self._stored = set(self._table["files"].keys())
+        return self._table
+
+    @property
+    def columns(self) -> list:
+        return [column["name"] for column in self.table["columns"]]
+
+    @property
+    def dtypes(self) -> Dict[str, str]:
+        return {column["name"]: column["dtype"] for column in self.table["columns"]}
+
+    @property
+    def shape(self) -> tuple:
+        return self.table["n_rows"], len(self.table["columns"])
+
+    @property
+    def file_size(self) -> int:
+        return self.file_path.stat().st_size + sum(self.table["files"].values())
+
+    def read(self) -> None:
+        self._frame = self.read_columns(self.columns)
+        self._is_read = True
+
+    @logger.instrument("read", lambda leaf, result, columns: sum(leaf._size(leaf._column(name)) for name in columns))
+    def read_columns(self, columns: List[str]) -> "pandas.DataFrame":
+        """
+        Read only the given columns of the table
+        """
+        require_pandas()
+        if self._is_read:
+            return self._frame[list(columns)]
+        index = self._read_index()
+        content = {}
+        for name in columns:
+            column = self._column(name)
+            content[name] = self._series(self._read_chunks(column), column["dtype"], index)
+        return pandas.DataFrame(content, index=index, columns=list(columns))
+
+    def __getitem__(self, key):
+        """
+        A column as a Series or, for a list of names, the columns as a DataFrame
+        """
+        if isinstance(key, list):
+            return self.read_columns(key)
+        return self.read_columns([key])[key]
+
+    def __setitem__(self, key, values) -> None:
+        """
+        Replace or add a column, only that column is written on the next write
+        """
+        require_pandas()
+        series = values if isinstance(values, pandas.Series) else pandas.Series(values)
+        table = self.table
+        if len(table["columns"]) > 0 and len(series) != table["n_rows"]:
+            raise ValueError("A column of {:d} rows does not fit in a table of {:d} rows".format(len(series),
+                                                                                                table["n_rows"]))
+        if len(table["columns"]) == 0 and table["index"] is None:
+            table["n_rows"] = len(series)
+        column = self._new_column(key, series)
+        names = self.columns
+        if key in names:
+            self._drop_chunks(table["columns"][names.index(key)])
+            table["columns"][names.index(key)] = column
+        else:
+            table["columns"] += [column]
+        if self._is_read:
+            self._frame[key] = series.to_numpy()
+        self._dirty = True
+
+    def __delitem__(self, key) -> None:
+        column = self._column(key)
+        self._drop_chunks(column)
+        self.table["columns"].remove(column)
+        if self._is_read:
+            del self._frame[key]
+        self._dirty = True
+
+    def append(self, frame: "pandas.DataFrame") -> None:
+        """
+        Append the rows of the frame, the rows are written as new chunks
+        without touching the chunks on disk. A table with the default
+        index keeps numbering its rows
+        """
+        require_pandas()
+        LeafDataFrame._check_frame(frame)
+        table = self.table
+        if sorted(map(str, frame.columns)) != sorted(map(str, self.columns)):
+            raise ValueError("The columns {:s} do not match the columns of the table {:s}".format(
+                str(list(frame.columns)), str(self.columns)))
+        if len(frame) == 0:
+            return
+
+        keep_index = table["index"] is not None or not LeafDataFrame._default_index(frame.index)
+        if keep_index:
+            if table["index"] is None:
+                table["index"] = self._new_column(None, pandas.Series(numpy.arange(table["n_rows"])))
+            table["index"]["files"] += [self._add_chunk(LeafDataFrame._to_array(frame.index))]
+        for column in table["columns"]:
+            column["files"] += [self._add_chunk(LeafDataFrame._to_array(frame[column["name"]]))]
+        table["n_rows"] += len(frame)
+
+        if self._is_read:
+            self._frame = pandas.concat([self._frame, frame[self.columns]], ignore_index=not keep_index)
+        self._dirty = True
+
+    def write(self, writer=None) -> None:
+        if self._dirty and writer is not None:
+            self._makedirs(writer)
+            self._targets = [(writer.target(self.path / name), name) for name in self._pending]
+        super().write(writer)
+
+    def remove(self) -> None:
+        shutil.rmtree(self.path)
+
+    # protected functions
+    def _opened(self) -> None:
+        super()._opened()
+        self._table = None
+
+    def _get_data(self) -> "pandas.DataFrame":
+        cache = self.dataset.cache
+        if not self._is_read:
+            self.read()
+            if cache is not None:
+                cache.add(self, int(self._frame.memory_usage(index=True).sum()))
+        elif cache is not None:
+            cache.hit(self)
+        return self._frame
+
+    def _set_data(self, frame: "pandas.DataFrame") -> None:
+        require_pandas()
+        LeafDataFrame._check_frame(frame)
+        table = self.table
+        for column in table["columns"] + ([] if table["index"] is None else [table["index"]]):
+            self._drop_chunks(column)
+        table["n_rows"] = len(frame)
+        table["index"] = None if LeafDataFrame._default_index(frame.index) else self._new_column(frame.index.name,
+                                                                                                frame.index)
+        table["columns"] = [self._new_column(name, frame[name]) for name in frame.columns]
+        self._frame = frame
+        self._is_read = True
+        cache = self.dataset.cache
+        if cache is not None:
+            cache.add(self, int(frame.memory_usage(index=True).sum()), loaded=False)
+
+    def _unload(self) -> None:
+        self._frame = None
+        self._is_read = False
+
+    def _column(self, name) -> Dict:
+        for column in self.table["columns"]:
+            if column["name"] == name:
+                return column
+        raise KeyError("The table has no column {:s}".format(str(name)))
+
+    def _size(self, column: Dict) -> int:
+        return sum(self.table["files"].get(name, 0) for name in column["files"])
+
+    def _new_column(self, name, values) -> Dict:
+        return {
+            "name": name,
+            "dtype": str(values.dtype),
+            "files": [self._add_chunk(LeafDataFrame._to_array(values))]
+        }
+
+    def _add_chunk(self, values: numpy.ndarray) -> str:
+        table = self.table
+        name = ".c{:d}.npy".format(table["next_file"])
+        table["next_file"] += 1
+        table["files"][name] = values.nbytes
+        self._pending[name] = values
+        return name
+
+    def _drop_chunks(self, column: Dict) -> None:
+        # the chunks on disk are deleted on the write after the next one,
+        # until then the table on disk still uses them
+        for name in column["files"]:
+            self.table["files"].pop(name, None)
+            self._pending.pop(name, None)
+
+    def _read_index(self) -> "pandas.Index":
+        table = self.table
+        if table["index"] is None:
+            return pandas.RangeIndex(table["n_rows"])
+        index = pandas.Index(self._read_chunks(table["index"]), name=table["index"]["name"])
+        if str(index.dtype) != table["index"]["dtype"]:
+            index = index.astype(table["index"]["dtype"])
+        return index
+
+    def _read_chunks(self, column: Dict) -> numpy.ndarray:
+        chunks = [self._read_chunk(name) for name in column["files"]]
+        if len(chunks) == 1:
+            return chunks[0]
+        return numpy.concatenate(chunks)
+
+    def _read_chunk(self, name: str) -> numpy.ndarray:
+        if name in self._pending:
+            return self._pending[name]
+        return numpy.load(self.path / name, mmap_mode=self.dataset.mmap_mode, allow_pickle=False)
+
+    @logger.instrument("write", logger.written_bytes)
+    def _write_child(self, path: Path) -> None:
+        table = self.table
+        for path_chunk, name in self._targets:
+            with path_chunk.open("wb") as chunk_file:
+                numpy.save(chunk_file, self._pending[name])
+            table["files"][name] = path_chunk.stat().st_size
+        path.write_text(json.dumps(table, separators=(",", ":")))
+
+        # chunks that are neither in the old nor in the new table
+        used = self._stored | set(table["files"].keys())
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if LeafDataFrame.chunk_name.match(entry.name) and entry.name not in used:
+                    os.unlink(entry.path)
+        self._stored = set(table["files"].keys())
+        self._pending = {}
+        self._targets = []
+
+    def _update_size(self, path: Path) -> None:
+        # the table is written last, the sizes of its chunks are in the table
+        size = path.stat().st_size + sum(self.table["files"].values())
+        self._parent._add_size(size - self.size)
+        self.meta.update_file_properties(size=size, n_childs=0)
+
+    @staticmethod
+    def _empty_table() -> Dict:
+        return {"n_rows": 0, "next_file": 0, "index": None, "columns": [], "files": {}}
+
+    @staticmethod
+    def _series(values: numpy.ndarray,
+                dtype: str,
+                index: "pandas.Index") -> "pandas.Series":
+        series = pandas.Series(values, index=index, copy=False)
+        if str(series.dtype) != dtype:
+            series = series.astype(dtype)
+        return series
+
+    @staticmethod
+    def _to_array(values) -> numpy.ndarray:
+        values = values.to_numpy()
+        # strings are stored as fixed width unicode to keep them memory-mappable
+        if values.dtype == object and pandas.api.types.infer_dtype(values, skipna=False) == "string":
+            values = values.astype(str)
+        if values.dtype.hasobject:
+            # python objects could only be stored pickled, which is unsafe to load
+            raise TypeError("Columns of python objects, other than strings, can not be stored")
+        return values
+
+    @staticmethod
+    def _default_index(index: "pandas.Index") -> bool:
+        return isinstance(index, pandas.RangeIndex) and index.start == 0 and index.step == 1 and index.name is None
+
+    @staticmethod
+    def _check_frame(frame: "pandas.DataFrame") -> None:
+        if isinstance(frame.columns, pandas.MultiIndex) or isinstance(frame.index, pandas.MultiIndex):
+            raise ValueError("DataFrames with a MultiIndex are not supported")
+        if not frame.columns.is_unique:
+            raise ValueError("The columns of the DataFrame must be unique")
+        for values in [frame.index] + [frame[name] for name in frame.columns]:
+            if values.dtype == object and pandas.api.types.infer_dtype(values, skipna=False) != "string":
+                raise TypeError("Columns of python objects, other than strings, can not be stored")
+
+
+available_formats = {
+    "frame": LeafDataFrame,
+}
+available_types = {} if pandas is None else {
+    pandas.DataFrame: LeafDataFrame,
+}
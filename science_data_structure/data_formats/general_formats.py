@@ -1,11 +1,17 @@
 import numpy
+import os
+import struct
 from pathlib import Path
+from typing import Iterator, List
 from structures import Leaf, Node
+import logger
 from meta import Meta
 
 
 class LeafNumpy(Leaf):
 
+    extension = "npy"
+
     def __init__(self,
                  parent: Node,
                  name: str,
@@ -15,32 +21,336 @@ class LeafNumpy(Leaf):
                          meta)
         self._data = None  # type: numpy.ndarray
         self._is_read = False
+        self._mmap_mode = None  # type: str
+        self._mapped = None  # type: numpy.memmap
+
+    @property
+    def mmap_mode(self) -> str:
+        """
+        Memory-map mode used to read the data, falls back on the mode of the data-set
+        """
+        if self._mmap_mode is None:
+            return self.dataset.mmap_mode
+        return self._mmap_mode
+
+    @mmap_mode.setter
+    def mmap_mode(self, mmap_mode: str) -> None:
+        self._mmap_mode = mmap_mode
+        # read the data again on the next access when it is not changed
+        if not self._dirty:
+            self._data = None
+            self._mapped = None
+            self._is_read = False
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        if self._is_read:
+            return self._data.dtype
+        return self._read_header()[2]
 
+    @property
+    def shape(self) -> tuple:
+        if self._is_read:
+            return self._data.shape
+        return self._read_header()[0]
+
+    @logger.instrument("read", logger.read_bytes)
     def read(self) -> numpy.ndarray:
-        self._data = numpy.load(self.path / "data.npy")
+        mmap_mode = self.mmap_mode
+        self._data = numpy.load(self.file_path, mmap_mode=mmap_mode)
+        self._mapped = self._data if mmap_mode is not None else None
         self._is_read = True
 
+    def __getitem__(self, key) -> numpy.ndarray:
+        """
+        Read a region of the data, when the data is not loaded only the
+        requested region is read from the file
+        """
+        if self._is_read:
+            return self._data[key]
+        return numpy.array(self._map_file("r")[key])
+
+    def __setitem__(self, key, value) -> None:
+        """
+        Write a region of the data, when the leaf is already on disk the
+        region is patched in place in the file
+        """
+        if self._dirty and self._is_read:
+            # the data is written as a whole on the next write
+            self._data[key] = value
+            return
+        region = self._map_file("r+")
+        region[key] = value
+        region.flush()
+        if self._is_read and self._mapped is None:
+            self._data[key] = value
+
+    def _map_file(self, mode: str) -> numpy.memmap:
+        """
+        Map the array in the file, the offset of the data follows from the header
+        """
+        shape, fortran_order, dtype, offset = self._read_header()
+        return numpy.memmap(self.file_path,
+                            dtype=dtype,
+                            mode=mode,
+                            offset=offset,
+                            shape=shape,
+                            order="F" if fortran_order else "C")
+
+    def _read_header(self) -> tuple:
+        """
+        Shape, fortran order, dtype and data offset from the header of the file
+        """
+        with self.file_path.open("rb") as npy_file:
+            version = numpy.lib.format.read_magic(npy_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(npy_file)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(npy_file)
+            return shape, fortran_order, dtype, npy_file.tell()
+
     def _get_data(self):
+        cache = self.dataset.cache
         if not self._is_read:
             self.read()
+            # memory-maps are left to the page cache
+            if cache is not None and self._mapped is None:
+                cache.add(self, self._data.nbytes)
+        elif cache is not None:
+            cache.hit(self)
         return self._data
 
     def _set_data(self, data: numpy.ndarray) -> None:
         self._data = data
+        self._is_read = True
+        cache = self.dataset.cache
+        if cache is not None:
+            cache.add(self, data.nbytes, loaded=False)
+
+    def _unload(self) -> None:
+        self._data = None
+        self._is_read = False
 
     def remove(self) -> None:
-        (self.path / "data.npy").unlink()
+        self.file_path.unlink()
         self.meta.path.unlink()
         self.path.rmdir()
 
-    def _write_child(self) -> None:
-        numpy.save(self.path / "data.npy", self._data)
+    @logger.instrument("write", logger.written_bytes)
+    def _write_child(self, path: Path) -> None:
+        if not self._is_read:
+            # the data on disk is unchanged
+            return
+        if self._mapped is None or path != self.file_path:
+            # write through a file object, numpy.save adds .npy to other names
+            with path.open("wb") as numpy_file:
+                numpy.save(numpy_file, self._data)
+            if path != self.file_path:
+                self._mapped = None
+        elif self._data is self._mapped and self._mapped.mode == "r+":
+            # changes to a writable memory-map end up in the file itself
+            self._mapped.flush()
+        else:
+            # the file is memory-mapped, replace it instead of truncating it under the map
+            path_tmp = self.path / ".data.npy.tmp"
+            with path_tmp.open("wb") as tmp_file:
+                numpy.save(tmp_file, self._data)
+            os.replace(path_tmp, path)
+            self._mapped = None
+
+
+class LeafNumpyAppend(Leaf):
+    """
+    Leaf for arrays that grow along the first axis. Appended rows are kept
+    in memory until the next write, which adds them to the end of the file
+    and updates the shape in the header. The file is a regular .npy file
+    with room in the header for the shape to grow
+    """
+
+    extension = "npa"
+    header_margin = 32
+
+    def __init__(self,
+                 parent: Node,
+                 name: str,
+                 meta: Meta) -> None:
+        super().__init__(parent,
+                         name,
+                         meta)
+        self._dtype = None  # type: numpy.dtype
+        self._row_shape = None  # type: tuple
+        self._n_rows = 0  # rows in the file
+        self._header_size = None  # type: int
+        self._buffer = []  # type: List[numpy.ndarray]
+        # a new leaf is empty and replaces what might be on disk
+        self._replace = True
+        self._is_read = True
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        self._read_header()
+        return self._dtype
+
+    @property
+    def shape(self) -> tuple:
+        if self.dtype is None:
+            return None
+        return (self.n_rows, ) + self._row_shape
+
+    @property
+    def n_rows(self) -> int:
+        self._read_header()
+        return self._n_rows + sum(map(len, self._buffer))
+
+    def append(self, rows) -> None:
+        """
+        Append rows to the array, a single row is accepted as well
+        """
+        self._read_header()
+        rows = numpy.asarray(rows, dtype=self._dtype)
+        if self._row_shape is None:
+            self._dtype = rows.dtype
+            self._row_shape = rows.shape[1:]
+        if rows.shape == self._row_shape:
+            rows = rows[numpy.newaxis]
+        if rows.shape[1:] != self._row_shape:
+            raise ValueError("Rows of shape {:s} do not fit in an array of rows with shape {:s}".format(str(rows.shape[1:]),
+                                                                                                         str(self._row_shape)))
+        self._buffer += [rows]
+        self._dirty = True
+
+    def iter_batches(self, batch_size: int) -> Iterator[numpy.ndarray]:
+        """
+        Stream the array in batches of at most batch_size rows
+        """
+        self._read_header()
+        if self._n_rows > 0 and not self._replace:
+            row_bytes = self._dtype.itemsize * int(numpy.prod(self._row_shape))
+            with self.file_path.open("rb") as npa_file:
+                npa_file.seek(self._header_size)
+                for start in range(0, self._n_rows, batch_size):
+                    n_batch = min(batch_size, self._n_rows - start)
+                    batch = numpy.frombuffer(npa_file.read(n_batch * row_bytes), dtype=self._dtype)
+                    yield batch.reshape((n_batch, ) + self._row_shape)
+        if len(self._buffer) > 0:
+            buffered = numpy.concatenate(self._buffer)
+            for start in range(0, len(buffered), batch_size):
+                yield buffered[start:start + batch_size]
+
+    def flush(self) -> None:
+        """
+        Write the appended rows to disk
+        """
+        self.write()
+
+    @logger.instrument("read", logger.read_bytes)
+    def read(self) -> None:
+        self._read_header()
+
+    def _opened(self) -> None:
+        super()._opened()
+        self._replace = False
+        self._is_read = False
+
+    def remove(self) -> None:
+        self.file_path.unlink()
+        self.meta.path.unlink()
+        self.path.rmdir()
+
+    def _get_data(self) -> numpy.ndarray:
+        self._read_header()
+        parts = list(self._buffer)
+        if self._n_rows > 0 and not self._replace:
+            parts = [numpy.load(self.file_path, mmap_mode=self.dataset.mmap_mode)] + parts
+        if len(parts) == 0:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def _set_data(self, data: numpy.ndarray) -> None:
+        data = numpy.asarray(data)
+        self._dtype = data.dtype
+        self._row_shape = data.shape[1:]
+        self._buffer = [data]
+        self._replace = True
+        self._is_read = True
+
+    def _read_header(self) -> None:
+        if self._is_read:
+            return
+        self._is_read = True
+        if not self.file_path.exists():
+            return
+        with self.file_path.open("rb") as npa_file:
+            numpy.lib.format.read_magic(npa_file)
+            shape, fortran_order, self._dtype = numpy.lib.format.read_array_header_1_0(npa_file)
+            self._header_size = npa_file.tell()
+        self._n_rows = shape[0]
+        self._row_shape = shape[1:]
+
+    def _header(self, n_rows: int) -> bytes:
+        header = repr({
+            "descr": numpy.lib.format.dtype_to_descr(self._dtype),
+            "fortran_order": False,
+            "shape": (n_rows, ) + self._row_shape
+        })
+        # magic string, version and header length take 10 bytes, the header ends with a newline
+        if self._header_size is None:
+            self._header_size = (10 + len(header) + self.header_margin + 1 + 63) // 64 * 64
+        length = self._header_size - 10
+        if len(header) + 1 > length:
+            raise ValueError("The shape does not fit in the header of {:s}".format(str(self.file_path)))
+        header = header.ljust(length - 1) + "\n"
+        return numpy.lib.format.magic(1, 0) + struct.pack("<H", length) + header.encode("latin1")
+
+    @property
+    def writes_in_place(self) -> bool:
+        # appended rows go to the end of the existing file
+        return not self._replace
+
+    @property
+    def in_place_header_size(self) -> int:
+        # the shape in the header is updated
+        self._read_header()
+        return 0 if self._header_size is None else self._header_size
+
+    @logger.instrument("write", logger.written_bytes)
+    def _write_child(self, path: Path) -> None:
+        if len(self._buffer) == 0 and not self._replace:
+            return
+        n_rows = 0 if self._replace else self._n_rows
+        n_rows += sum(map(len, self._buffer))
+
+        if self._replace or not path.exists():
+            self._header_size = None
+            mode = "wb"
+        else:
+            mode = "r+b"
+        with path.open(mode) as npa_file:
+            if mode == "wb":
+                npa_file.write(self._header(n_rows))
+            else:
+                # rows past those counted in the header are left over from an interrupted write
+                end = self._header_size + self._n_rows * self._dtype.itemsize * int(numpy.prod(self._row_shape))
+                npa_file.seek(end)
+                npa_file.truncate()
+            for rows in self._buffer:
+                npa_file.write(numpy.ascontiguousarray(rows).tobytes())
+            if mode == "r+b":
+                # the shape in the header is only updated once the rows are written
+                npa_file.seek(0)
+                npa_file.write(self._header(n_rows))
+
+        self._n_rows = n_rows
+        self._buffer = []
+        self._replace = False
 
 
 available_formats = {
     "npy": LeafNumpy,
+    "npa": LeafNumpyAppend,
 }
 available_types = {
     numpy.ndarray: LeafNumpy
 }
-
@@ -0,0 +1,273 @@
+import ast
+import contextlib
+import io
+import json
+import os
+import struct
+import numpy
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+from structures import Leaf, Node
+from meta import Meta
+from writer import Writer
+import logger
+
+
+class Pack:
+    """
+    Container file holding the small leafs of a branch. The file holds the
+    arrays, as .npy data, one after the other followed by an index with the
+    position, dtype, shape and meta of every leaf, and the length of that
+    index. A packed leaf has no folder, meta or data file of its own, the
+    pack is written as a whole when one of its leafs changed
+    """
+
+    file_name = ".pack"
+
+    def __init__(self,
+                 branch) -> None:
+        self._branch = branch
+        self._index = None  # type: Dict[str, Dict]
+        self.dirty = False
+
+    @property
+    def path(self) -> Path:
+        return self._branch.path / Pack.file_name
+
+    @property
+    def index(self) -> Dict[str, Dict]:
+        if self._index is None:
+            self._index = Pack.read_index(self.path) if self.path.exists() else {}
+        return self._index
+
+    def keys(self) -> List[str]:
+        return list(self.index.keys())
+
+    def read_bytes(self, key: str) -> bytes:
+        entry = self.index[key]
+        with self.path.open("rb") as pack_file:
+            pack_file.seek(entry["offset"])
+            return pack_file.read(entry["length"])
+
+    def read_array(self, key: str) -> numpy.ndarray:
+        return numpy.lib.format.read_array(io.BytesIO(self.read_bytes(key)))
+
+    def write(self, writer) -> None:
+        """
+        Gather the packed leafs of the branch and write the pack. Changed
+        leafs are serialized here, the others are copied from the old pack
+        when the pack is written, as the offset and length of their bytes
+        """
+        chunks = []  # type: List[Union[bytes, Tuple[int, int]]]
+        index = {}  # type: Dict[str, Dict]
+        offset = 0
+        for key, leaf in self._branch._content.items():
+            if not isinstance(leaf, LeafPacked):
+                continue
+            if leaf._is_read:
+                buffer = io.BytesIO()
+                numpy.lib.format.write_array(buffer, numpy.asanyarray(leaf._data), allow_pickle=False)
+                chunk = buffer.getvalue()
+                leaf._parent._add_size(len(chunk) - leaf.size)
+                leaf.meta.update_file_properties(size=len(chunk), n_childs=0)
+                descr = numpy.lib.format.dtype_to_descr(leaf._data.dtype)
+                shape = list(leaf._data.shape)
+                length = len(chunk)
+            elif key in self.index:
+                length = self.index[key]["length"]
+                chunk = (self.index[key]["offset"], length)
+                descr = ast.literal_eval(self.index[key]["descr"])
+                shape = self.index[key]["shape"]
+            else:
+                raise ValueError("The packed leaf {:s} has no data".format(key))
+            meta = leaf.meta.__dict__()
+            leaf.meta._dirty = False
+            index[key] = self._entry(offset, length, descr, shape, meta)
+            chunks += [chunk]
+            offset += length
+
+        # leafs that were never loaded are copied as they are
+        for key, path in self._branch._lazy_content.items():
+            if path.name != Pack.file_name:
+                continue
+            entry = dict(self.index[key])
+            chunks += [(entry["offset"], entry["length"])]
+            entry["offset"] = offset
+            index[key] = entry
+            offset += entry["length"]
+
+        writer.submit(self._write_file, writer.target(self.path), chunks, index)
+        self.dirty = False
+
+    @staticmethod
+    def read_index(path: Path) -> Dict[str, Dict]:
+        with path.open("rb") as pack_file:
+            pack_file.seek(-8, os.SEEK_END)
+            length = struct.unpack("<Q", pack_file.read(8))[0]
+            pack_file.seek(-8 - length, os.SEEK_END)
+            return json.loads(pack_file.read(length).decode("utf-8"))
+
+    # protected functions
+    @staticmethod
+    def _entry(offset: int,
+               length: int,
+               descr,
+               shape: list,
+               meta: Dict) -> Dict:
+        return {
+            "offset": offset,
+            "length": length,
+            "descr": repr(descr),
+            "shape": shape,
+            "meta": meta
+        }
+
+    def _write_file(self,
+                    path: Path,
+                    chunks: List[Union[bytes, Tuple[int, int]]],
+                    index: Dict[str, Dict]) -> None:
+        # the old pack is read while the new one is written, never overwrite it in place
+        path_tmp = path if path != self.path else self.path.with_name(".pack.tmp")
+        index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        copied = any(isinstance(chunk, tuple) for chunk in chunks)
+        with path_tmp.open("wb") as pack_file, \
+                (self.path.open("rb") if copied else contextlib.nullcontext()) as old_file:
+            for chunk in chunks:
+                if isinstance(chunk, tuple):
+                    old_file.seek(chunk[0])
+                    chunk = old_file.read(chunk[1])
+                pack_file.write(chunk)
+            pack_file.write(index_bytes)
+            pack_file.write(struct.pack("<Q", len(index_bytes)))
+        if path_tmp != path:
+            os.replace(path_tmp, path)
+        self._index = index
+
+
+class LeafPacked(Leaf):
+    """
+    Small numpy array stored in the pack of its branch, see Pack
+    """
+
+    extension = "packed"
+
+    def __init__(self,
+                 parent: Node,
+                 name: str,
+                 meta: Meta) -> None:
+        super().__init__(parent,
+                         name,
+                         meta)
+        self._data = None  # type: numpy.ndarray
+        self._is_read = False
+
+    @property
+    def key(self) -> str:
+        return self._name[:-5]
+
+    @property
+    def pack(self) -> Pack:
+        return self._parent.pack
+
+    @property
+    def file_path(self) -> Path:
+        return self.pack.path
+
+    @property
+    def file_size(self) -> int:
+        entry = self.pack.index.get(self.key)
+        return 0 if entry is None else entry["length"]
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        if self._is_read:
+            return self._data.dtype
+        return numpy.lib.format.descr_to_dtype(ast.literal_eval(self.pack.index[self.key]["descr"]))
+
+    @property
+    def shape(self) -> tuple:
+        if self._is_read:
+            return self._data.shape
+        return tuple(self.pack.index[self.key]["shape"])
+
+    @logger.instrument("read", logger.read_bytes)
+    def read(self) -> None:
+        self._data = self.pack.read_array(self.key)
+        self._is_read = True
+
+    def write(self, writer: Writer = None) -> None:
+        """
+        The leaf is written with the pack of its branch, written on its own
+        the pack is written right away
+        """
+        if not self.is_dirty:
+            return
+        if writer is None:
+            writer = Writer()
+            self.write(writer)
+            self._parent._makedirs(writer)
+            self.pack.write(writer)
+            writer.defer(self._write_ancestor_metas, writer)
+            writer.finish()
+            self.dataset._after_write(writer)
+            return
+
+        self.pack.dirty = True
+        self._dirty = False
+        writer.defer(writer.node_written, self)
+
+    def remove(self) -> None:
+        # the pack is removed with the branch
+        pass
+
+    # protected functions
+    def _exists_on_disk(self) -> bool:
+        return self.key in self.pack.index
+
+    def _remove_from_disk(self, writer: Writer = None) -> None:
+        # the pack of the branch is written again without the leaf
+        self.pack.dirty = True
+        if writer is not None:
+            writer.removed.append(self.path)
+
+    def _get_data(self) -> numpy.ndarray:
+        cache = self.dataset.cache
+        if not self._is_read:
+            self.read()
+            if cache is not None:
+                cache.add(self, self._data.nbytes)
+        elif cache is not None:
+            cache.hit(self)
+        return self._data
+
+    def _set_data(self, data: numpy.ndarray) -> None:
+        self._data = data
+        self._is_read = True
+        cache = self.dataset.cache
+        if cache is not None:
+            cache.add(self, data.nbytes, loaded=False)
+
+    def _unload(self) -> None:
+        self._data = None
+        self._is_read = False
+
+    def _write_child(self, path: Path) -> None:
+        raise NotImplementedError("Packed leafs are written with the pack of their branch")
+
+    @staticmethod
+    def from_pack(parent: Node,
+                  key: str) -> "LeafPacked":
+        """
+        Create a leaf stored in the pack of the parent
+        """
+        meta = Meta.from_dict(parent.pack.index[key]["meta"],
+                              parent.path / "{:s}.leaf".format(key) / ".meta.json",
+                              parent.top_level_meta)
+        leaf = LeafPacked(parent, "{:s}.leaf".format(key), meta)
+        leaf._opened()
+        return leaf
+
+
+available_formats = {
+    "packed": LeafPacked,
+}
@@ -0,0 +1,53 @@
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+from data_formats import compressed_formats
+
+
+class TestLeafCompressed(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_compressed_formats")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_codecs(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "codecs",
+                                                   self._author)
+        data = numpy.zeros((1000, 7))
+        data[::13] = numpy.random.random((77, 7))
+        for extension in compressed_formats.available_formats.keys():
+            leaf = dataset.add_leaf(extension, data, leaf_format=extension)
+            # force multiple chunks
+            leaf.chunk_size = 1000
+        dataset.add_leaf("scalar", numpy.array(3.0), leaf_format="zlib")
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        for extension in compressed_formats.available_formats.keys():
+            leaf = dataset_read[extension]
+            self.assertIsInstance(leaf, compressed_formats.available_formats[extension])
+            self.assertLess(leaf.file_path.stat().st_size, data.nbytes)
+            self.assertTrue(numpy.all(leaf[100:250, 2] == data[100:250, 2]))
+            self.assertTrue(numpy.all(leaf[-1] == data[-1]))
+            self.assertTrue(numpy.all(leaf[900:100:-7] == data[900:100:-7]))
+            self.assertEqual(leaf[5:5].shape, (0, 7))
+            self.assertTrue(numpy.all(leaf.data == data))
+        self.assertEqual(dataset_read["scalar"].data, 3.0)
+
+    def test_dataset_format(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "dataset_format",
+                                                   self._author)
+        dataset.array_format = "lzma"
+        dataset["x"] = numpy.arange(100)
+        self.assertIsInstance(dataset["x"], compressed_formats.LeafLzma)
+        dataset.write()
+        self.assertTrue((dataset["x"].path / "data.lzma").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
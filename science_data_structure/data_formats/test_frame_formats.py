@@ -0,0 +1,105 @@
+import shutil
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+from data_formats import frame_formats
+pandas = frame_formats.pandas
+
+
+@unittest.skipIf(pandas is None, "pandas is not installed")
+class TestLeafDataFrame(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_frame_formats")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_columns(self):
+        shutil.rmtree(self._test_path / "frame.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "frame",
+                                                   self._author)
+        frame = pandas.DataFrame({"column_{:d}".format(i_column): numpy.arange(100) * i_column
+                                  for i_column in range(20)})
+        frame["name"] = ["row_{:d}".format(i_row) for i_row in range(100)]
+        dataset["table"] = frame
+        dataset.write()
+        self.assertIsInstance(dataset["table"], frame_formats.LeafDataFrame)
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, mmap_mode="r")
+        leaf = dataset_read["table"]
+        self.assertEqual(leaf.shape, (100, 21))
+        self.assertEqual(leaf.size, dataset["table"].size)
+        pandas.testing.assert_frame_equal(leaf.data, frame)
+
+        # only the requested columns are read
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        leaf = dataset_read["table"]
+        columns = leaf[["column_3", "name"]]
+        self.assertEqual(list(columns.columns), ["column_3", "name"])
+        self.assertTrue(numpy.all(columns["column_3"] == numpy.arange(100) * 3))
+        self.assertFalse(leaf._is_read)
+
+        # a replaced column and appended rows are written as new chunks only
+        files = set(path.name for path in leaf.path.iterdir())
+        leaf["column_3"] = -numpy.arange(100)
+        leaf.append(frame.iloc[:10])
+        dataset_read.write()
+        new_files = set(path.name for path in leaf.path.iterdir()) - files
+        self.assertEqual(len(new_files), 1 + 21)
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        data = dataset_read["table"].data
+        self.assertEqual(data.shape, (110, 21))
+        self.assertTrue(numpy.all(data["column_3"].to_numpy()[:100] == -numpy.arange(100)))
+        self.assertTrue(numpy.all(data["column_3"].to_numpy()[100:] == numpy.arange(10) * 3))
+        self.assertEqual(list(data.index), list(range(110)))
+        self.assertEqual(data["name"].iloc[105], "row_5")
+
+        # dropped chunks are deleted once the table on disk no longer uses them
+        del dataset_read["table"]["column_0"]
+        dataset_read.write(transactional=True)
+        files = [path.name for path in dataset_read["table"].path.iterdir()]
+        self.assertNotIn(".c3.npy", files)
+        self.assertIn(".c0.npy", files)
+        self.assertNotIn("column_0", StructuredDataSet.open_dataset(dataset.path)["table"].columns)
+
+    def test_index(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "frame_index",
+                                                   self._author)
+        frame = pandas.DataFrame({"x": numpy.linspace(0, 1, 5)},
+                                 index=pandas.date_range("2020-01-01", periods=5, name="time"))
+        dataset["table"] = frame
+        dataset.write()
+        dataset["table"].append(pandas.DataFrame({"x": [2.0]}, index=pandas.DatetimeIndex(["2021-01-01"],
+                                                                                         name="time")))
+        dataset.write()
+
+        data = StructuredDataSet.open_dataset(dataset.path)["table"].data
+        self.assertEqual(data.index.name, "time")
+        self.assertEqual(data.index[-1], pandas.Timestamp("2021-01-01"))
+        self.assertEqual(len(data), 6)
+
+    def test_objects(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "frame_objects",
+                                                   self._author)
+        frame = pandas.DataFrame({"x": numpy.arange(3), "y": [{"a": 1}, None, "text"]})
+        with self.assertRaises(TypeError):
+            dataset["table"] = frame
+        self.assertNotIn("table", dataset.keys())
+
+        dataset["table"] = frame[["x"]]
+        with self.assertRaises(TypeError):
+            dataset["table"]["y"] = frame["y"]
+        with self.assertRaises(TypeError):
+            dataset["table"].append(frame)
+        dataset.write()
+        self.assertEqual(StructuredDataSet.open_dataset(dataset.path)["table"].columns, ["x"])
+
+
+if __name__ == "__main__":
+    unittest.main()
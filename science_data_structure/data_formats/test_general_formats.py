@@ -0,0 +1,117 @@
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+
+
+class TestLeafNumpy(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_general_formats")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_memory_map(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "memory_map",
+                                                   self._author)
+        dataset["x"] = numpy.arange(1000).reshape((100, 10))
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, mmap_mode="r")
+        x = dataset_read["x"].data
+        self.assertIsInstance(x, numpy.memmap)
+        self.assertTrue(numpy.all(x[10:20] == numpy.arange(100, 200).reshape((10, 10))))
+
+        # a writable map of a single leaf
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        leaf = dataset_read["x"]
+        leaf.mmap_mode = "r+"
+        leaf.data[0, 0] = -1
+        leaf.set_dirty()
+        dataset_read.write()
+        self.assertEqual(numpy.load(leaf.path / "data.npy")[0, 0], -1)
+
+        # replacing the data of a mapped leaf keeps the old map readable
+        leaf.data = numpy.zeros(5)
+        dataset_read.write()
+        self.assertEqual(x[1, 0], 10)
+        self.assertEqual(numpy.load(leaf.path / "data.npy").shape, (5, ))
+
+    def test_regions(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "regions",
+                                                   self._author)
+        dataset["x"] = numpy.arange(1000.0).reshape((100, 10))
+        dataset["f"] = numpy.asfortranarray(numpy.arange(1000.0).reshape((100, 10)))
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_read["x"][10:12, 2:4] == dataset["x"].data[10:12, 2:4]))
+        self.assertTrue(numpy.all(dataset_read["f"][:, 3] == dataset["f"].data[:, 3]))
+
+        # patch a block on disk, the leaf stays clean
+        leaf = dataset_read["x"]
+        leaf[20:30] = -1.0
+        self.assertFalse(leaf.is_dirty)
+        data = numpy.load(leaf.path / "data.npy")
+        self.assertTrue(numpy.all(data[20:30] == -1.0))
+        self.assertTrue(numpy.all(data[30:] == dataset["x"].data[30:]))
+
+        # a loaded leaf is patched in memory and on disk
+        self.assertTrue(numpy.all(leaf.data[20:30] == -1.0))
+        leaf[0] = 5.0
+        self.assertTrue(numpy.all(leaf.data[0] == 5.0))
+        self.assertTrue(numpy.all(numpy.load(leaf.path / "data.npy")[0] == 5.0))
+
+    def test_append(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "append",
+                                                   self._author)
+        leaf = dataset["acquisition"].add_leaf("rows", leaf_format="npa")
+        leaf.append(numpy.zeros((10, 3)))
+        dataset.write()
+
+        for i_row in range(1, 6):
+            leaf.append(numpy.full(3, i_row))
+            leaf.flush()
+        # the sizes of the ancestors are written with every flush
+        dataset_flushed = StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(dataset_flushed.size, leaf.file_size)
+        self.assertEqual(dataset_flushed["acquisition"].size, leaf.file_size)
+        leaf.append(numpy.ones((4, 3)))
+        self.assertEqual(leaf.n_rows, 19)
+        dataset.write()
+
+        # the file is a regular npy file
+        data = numpy.load(leaf.path / "data.npa")
+        self.assertEqual(data.shape, (19, 3))
+        self.assertTrue(numpy.all(data[10:15, 0] == numpy.arange(1, 6)))
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        leaf_read = dataset_read["acquisition"]["rows"]
+        leaf_read.append(numpy.full((1, 3), 7))
+        batches = list(leaf_read.iter_batches(8))
+        self.assertEqual(list(map(len, batches)), [8, 8, 3, 1])
+        self.assertTrue(numpy.all(numpy.concatenate(batches) == leaf_read.data))
+        self.assertEqual(leaf_read.data.shape, (20, 3))
+
+        with self.assertRaises(ValueError):
+            leaf_read.append(numpy.zeros((2, 4)))
+
+        # rows of an interrupted write, not counted in the header, are overwritten
+        dataset_read.write()
+        with (leaf.path / "data.npa").open("ab") as npa_file:
+            npa_file.write(numpy.full((2, 3), -1.0).tobytes())
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        leaf_read = dataset_read["acquisition"]["rows"]
+        leaf_read.append(numpy.full((1, 3), 8))
+        dataset_read.write()
+        data = numpy.load(leaf.path / "data.npa")
+        self.assertEqual(data.shape, (21, 3))
+        self.assertTrue(numpy.all(data[19:, 0] == [7, 8]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import shutil
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+from data_formats import packed_formats
+
+
+class TestLeafPacked(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_packed_formats")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_pack(self):
+        shutil.rmtree(self._test_path / "pack.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "pack",
+                                                   self._author)
+        dataset.pack_size = 1024
+        for i_leaf in range(100):
+            dataset["vectors"]["vector_{:d}".format(i_leaf)] = numpy.full(8, i_leaf)
+        dataset["vectors"]["large"] = numpy.zeros(1000)
+        dataset.write()
+
+        # a single file holds the small leafs
+        self.assertEqual(sorted(path.name for path in dataset["vectors"].path.iterdir()),
+                         [".meta.json", ".pack", "large.leaf"])
+        self.assertEqual(dataset["vectors"].meta.file_properties.n_childs, 101)
+        size = dataset["vectors"].size
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        leaf = dataset_read["vectors"]["vector_7"]
+        self.assertIsInstance(leaf, packed_formats.LeafPacked)
+        self.assertEqual(leaf.shape, (8, ))
+        self.assertEqual(leaf.dtype, numpy.full(8, 7).dtype)
+        self.assertTrue(numpy.all(leaf.data == 7))
+        self.assertEqual(len(dataset_read["vectors"].keys()), 101)
+        self.assertEqual(dataset_read.size, size)
+
+        # change, replace and remove packed leafs, the others are copied
+        dataset_read["vectors"]["vector_7"] = numpy.full(16, -1)
+        dataset_read["vectors"]["vector_8"] = None
+        dataset_read["vectors"]["vector_9"] = numpy.zeros(1000)
+        dataset_read.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        vectors = dataset_read["vectors"]
+        self.assertEqual(sorted(vectors.keys()), sorted(["vector_{:d}".format(i_leaf) for i_leaf in range(100)
+                                                         if i_leaf != 8] + ["large"]))
+        self.assertTrue(numpy.all(vectors["vector_7"].data == -1))
+        self.assertTrue(numpy.all(vectors["vector_99"].data == 99))
+        self.assertNotIsInstance(vectors["vector_9"], packed_formats.LeafPacked)
+        self.assertEqual(vectors.size, sum(leaf.size for path, leaf in vectors.iter_leaves()))
+
+        # a packed leaf written on its own writes the pack
+        vectors["vector_5"].data = numpy.full(4, -5)
+        vectors["vector_5"].write()
+        self.assertFalse(vectors["vector_5"].is_dirty)
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_read["vectors"]["vector_5"].data == -5))
+        self.assertTrue(numpy.all(dataset_read["vectors"]["vector_7"].data == -1))
+
+        # consolidated data-sets read the packed leafs from the pack
+        dataset_read.consolidate()
+        dataset_consolidated = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_consolidated["vectors"]["vector_3"].data == 3))
+
+        dataset_consolidated.remove()
+        self.assertFalse(dataset.path.exists())
+
+    def test_transactional(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "pack_transactional",
+                                                   self._author)
+        dataset.pack_size = 1024
+        dataset["x"] = numpy.arange(4)
+        dataset["y"] = numpy.arange(5)
+        dataset.write(transactional=True)
+        dataset["x"] = numpy.arange(6)
+        dataset.write(transactional=True, workers=2)
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_read["x"].data == numpy.arange(6)))
+        self.assertTrue(numpy.all(dataset_read["y"].data == numpy.arange(5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
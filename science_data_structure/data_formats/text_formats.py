@@ -0,0 +1,33 @@
+import numpy
+from typing import List
+from data_formats.general_formats import LeafNumpyAppend
+
+
+class LeafDelimited(LeafNumpyAppend):
+    """
+    Table read from delimited text, a csv or tab-separated file. The rows
+    are stored as an array growing along the first axis, see
+    LeafNumpyAppend, with a field per column of the text. The table is
+    memory-mapped and appended to like any other array, importing and
+    exporting the text is done by parsers.delimited_parser
+    """
+
+    extension = "dlm"
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        The names of the columns, None for a table of a single dtype
+        """
+        dtype = self.dtype
+        if dtype is None or dtype.names is None:
+            return None
+        return list(dtype.names)
+
+    def column(self, name: str) -> numpy.ndarray:
+        return self.data[name]
+
+
+available_formats = {
+    "dlm": LeafDelimited,
+}
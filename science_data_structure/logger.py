@@ -1,6 +1,12 @@
 from config import ConfigManager
 from core import JSONObject
 from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, List
+import functools
+import json
+import threading
+import time
 import uuid
 
 
@@ -10,35 +16,147 @@ class LogEntry(JSONObject):
                  log_id,
                  date: datetime,
                  author,
-                 action: str):
+                 action: str,
+                 node: str = None):
         self._author = author
         self._action = action
         self._date = date
         self._id = log_id
+        self._node = node
 
     @property
     def log_id(self):
         return self._id
 
+    @property
+    def date(self) -> datetime:
+        return self._date
+
+    @property
+    def action(self) -> str:
+        return self._action
+
+    @property
+    def node(self) -> str:
+        return self._node
+
     def __dict__(self):
         return {
-            "date": self._date.strftime("%s:%m:%h %D-%M-%Y"),
-            "author": self._author,
+            "id": str(self._id),
+            "date": self._date.isoformat(),
+            "author": None if self._author is None else str(self._author.author_id),
             "action": self._action,
+            "node": self._node
         }
 
     @staticmethod
-    def create_log(date, author, action):
+    def create_log(date, author, action, node: str = None):
         log_id = uuid.uuid4().int
-        return LogEntry(log_id, date, author, action)
+        return LogEntry(log_id, date, author, action, node)
+
+
+class ChangeLog:
+    """
+    The log of a data-set, an append-only file with one json line per entry
+    at the root of the data-set. Entries are buffered and appended to the
+    file once per write, the metas only keep the ids of their last entries
+    """
+
+    file_name = ".log.jsonl"
+
+    def __init__(self,
+                 path: Path) -> None:
+        self._path = path
+        self._buffer = []  # type: List[str]
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def add(self, log_entry: LogEntry) -> None:
+        line = json.dumps(log_entry.__dict__(), separators=(",", ":"))
+        with self._lock:
+            self._buffer += [line]
+
+    def flush(self) -> None:
+        """
+        Append the buffered entries to the log file
+        """
+        with self._lock:
+            if len(self._buffer) == 0:
+                return
+            with self._path.open("a") as log_file:
+                log_file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+
+    def entries(self, node: str = None) -> Iterator[dict]:
+        """
+        All the entries of the log, oldest first, optionally only those of
+        the node at the path relative to the data-set
+        """
+        self.flush()
+        if not self._path.exists():
+            return
+        with self._path.open() as log_file:
+            for line in log_file:
+                entry = json.loads(line)
+                if node is None or entry["node"] == node:
+                    yield entry
 
 
 # define logging decorators
-def logger(func):
+def logger(func=None, action: str = None):
+    """
+    Log a call of the decorated method of a node in the change log of its
+    data-set and in its meta. The action is the name of the method, unless
+    it is given, as in @logger(action="write")
+    """
+    if func is None:
+        return functools.partial(logger, action=action)
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         config = ConfigManager()
-        meta = (args[0]).meta
-        meta.add_log_entry(LogEntry.create_log(datetime.today(), config.default_author, func.__name__))
+        node = args[0]
+        dataset = node.dataset
+        log_entry = LogEntry.create_log(datetime.today(), config.default_author, action or func.__name__,
+                                        node.path.relative_to(dataset.path).as_posix())
+        dataset.change_log.add(log_entry)
+        node.meta.add_log_entry(log_entry)
 
-        func(*args, **kwargs)
+        return func(*args, **kwargs)
     return wrapper
+
+
+def instrument(operation: str,
+               n_bytes: Callable = None):
+    """
+    Record the time spent in the decorated method of a node in the stats of
+    its data-set, when the data-set collects stats. n_bytes(node, result,
+    *args) gives the bytes handled by the call
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(node, *args, **kwargs):
+            dataset = node.dataset
+            if dataset.stats is None:
+                return func(node, *args, **kwargs)
+            start = time.perf_counter()
+            result = func(node, *args, **kwargs)
+            seconds = time.perf_counter() - start
+            dataset.stats.record(node.path.relative_to(dataset.path).as_posix(),
+                                 operation,
+                                 seconds,
+                                 0 if n_bytes is None else n_bytes(node, result, *args))
+            return result
+        return wrapper
+    return decorator
+
+
+def written_bytes(leaf, result, path: Path) -> int:
+    return path.stat().st_size if path.exists() else 0
+
+
+def read_bytes(leaf, result) -> int:
+    return leaf.file_size
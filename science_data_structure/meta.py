@@ -1,8 +1,9 @@
 from pathlib import Path
 from typing import List
 from author import Author
-from core import JSONObject
+from core import JSONObject, to_dict
 from logger import LogEntry
+from collections import deque
 import uuid
 import json
 from typing import Dict
@@ -20,25 +21,57 @@ class NodeProperty(JSONObject):
 class Meta(JSONObject):
 
     id_counter = 0
+    # number of log entries referred to by a meta
+    log_size = 8
 
     def __init__(self,
                  path: Path,
                  dataset_id: int,
                  branch_id: int,
                  description: str = "",
-                 authors: List[Author] = [],
-                 log: Dict[int, LogEntry] = {},
-                 additional_properties: Dict[str, NodeProperty] = {}):
+                 authors: List[Author] = None,
+                 log: List[int] = None,
+                 additional_properties: Dict[str, NodeProperty] = None,
+                 author_table: "Meta" = None):
         self._path = path
         self._dataset_id = dataset_id
         self._branch_id = branch_id
         self._description = description
-        self._authors = authors
-        self._log = log
-        self._additional_properties = additional_properties
-
-    def write(self):
-        self.path.write_text(self.to_json())
+        # the top level meta holds the authors of the data-set, the metas of
+        # the nodes refer to them by id
+        self._author_table = author_table
+        self._authors = [] if authors is None else authors
+        self._author_ids = [author.author_id for author in self._authors] if author_table is not None else None
+        self._author_index = None  # type: Dict[int, Author]
+        # ids of the last entries of the node in the log of the data-set
+        self._log = deque([] if log is None else log, maxlen=Meta.log_size)
+        # every meta needs its own properties
+        self._additional_properties = {} if additional_properties is None else additional_properties
+        self._compact = False if author_table is None else author_table.compact
+        # the top level meta hands out the ids of the nodes of the data-set
+        self._next_id = None  # type: int
+        self._id_limit = None  # type: int
+        self._dirty = True
+
+    def write(self, writer=None) -> int:
+        """
+        Write the meta, returns the length of the json
+        """
+        text = self.to_json(self._compact)
+        if writer is None:
+            self.path.write_text(text)
+        else:
+            writer.write_text(self.path, text)
+        self._dirty = False
+        return len(text)
+
+    def to_json(self, compact: bool = False) -> str:
+        if not compact:
+            return super().to_json()
+        # leave out the empty fields
+        content = {key: value for key, value in self.__dict__().items()
+                   if not (isinstance(value, (str, list, dict)) and len(value) == 0)}
+        return json.dumps(content, default=to_dict, separators=(",", ":"))
 
     def __str__(self):
         line = "meta information \n"
@@ -60,10 +93,15 @@ class Meta(JSONObject):
         base_dict = {
             "dataset_id": self._dataset_id,
             "branch_id": self._branch_id,
-            "authors": self._authors,
             "description": self._description,
-            "log": self._log
+            "log": [str(log_id) for log_id in self._log]
         }
+        if self._author_table is None:
+            base_dict["authors"] = self._authors
+            if self._next_id is not None:
+                base_dict["next_branch_id"] = self._next_id
+        else:
+            base_dict["author_ids"] = [str(author_id) for author_id in self._author_ids]
         for property_name in self._additional_properties.keys():
             base_dict[property_name] = self._additional_properties[property_name].__dict__()
 
@@ -75,6 +113,11 @@ class Meta(JSONObject):
     @path.setter
     def path(self, path):
         self._path = path
+        self._dirty = True
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._dirty
 
     @property
     def dataset_id(self):
@@ -85,8 +128,91 @@ class Meta(JSONObject):
         return self._branch_id
 
     @property
-    def authors(self):
-        return self._authors
+    def authors(self) -> List[Author]:
+        if self._author_table is None:
+            return self._authors
+        return [self._author_table.author(author_id) for author_id in self._author_ids]
+
+    @property
+    def author_ids(self) -> List[int]:
+        if self._author_table is None:
+            return [author.author_id for author in self._authors]
+        return self._author_ids
+
+    def author(self, author_id: int) -> Author:
+        """
+        The author of the data-set with the id, from the top level meta
+        """
+        if self._author_table is not None:
+            return self._author_table.author(author_id)
+        if self._author_index is None:
+            self._author_index = {author.author_id: author for author in self._authors}
+        return self._author_index[author_id]
+
+    def add_author(self, author: Author) -> None:
+        """
+        Add an author to the node, the author is added to the authors of the
+        data-set as well
+        """
+        if self._author_table is None:
+            if author.author_id not in self.author_ids:
+                self._authors += [author]
+                self._author_index = None
+                self._dirty = True
+            return
+        self._author_table.add_author(author)
+        if author.author_id not in self._author_ids:
+            self._author_ids += [author.author_id]
+            self._dirty = True
+
+    def allocate_id(self) -> int:
+        """
+        A new branch id of the data-set, from the top level meta
+        """
+        if self._author_table is not None:
+            return self._author_table.allocate_id()
+        if self._next_id is None:
+            # data-sets created before the ids were stored in the top level meta
+            Meta.id_counter += 1
+            return Meta.id_counter
+        if self._id_limit is not None and self._next_id >= self._id_limit:
+            raise RuntimeError("The reserved block of branch ids is used up")
+        branch_id = self._next_id
+        self._next_id += 1
+        self._dirty = True
+        return branch_id
+
+    def reserve_ids(self, n_ids: int) -> int:
+        """
+        Reserve a block of n_ids branch ids, for building part of the
+        data-set elsewhere. Returns the first id of the block
+        """
+        first = self.allocate_id()
+        if self._next_id is not None:
+            self._next_id = first + n_ids
+        else:
+            Meta.id_counter = first + n_ids
+        return first
+
+    def _use_ids(self, first: int, n_ids: int) -> None:
+        """
+        Only hand out the ids of a reserved block
+        """
+        self._next_id = first
+        self._id_limit = first + n_ids
+
+    @property
+    def compact(self) -> bool:
+        """
+        Write the meta as compact json, without whitespace and empty fields
+        """
+        return self._compact
+
+    @compact.setter
+    def compact(self, compact: bool) -> None:
+        if compact != self._compact:
+            self._compact = compact
+            self._dirty = True
 
     @property
     def description(self):
@@ -95,6 +221,7 @@ class Meta(JSONObject):
     @description.setter
     def description(self, description: str):
         self._description = description
+        self._dirty = True
 
     @staticmethod
     def create_top_level_meta(path: Path,
@@ -103,44 +230,114 @@ class Meta(JSONObject):
         # create a uuid for the dataset
         dataset_id = uuid.uuid4().int
         branch_id = 0
-        Meta.id_counter += 1
         meta = Meta(path,
                     dataset_id,
                     branch_id,
                     description,
                     [author])
+        meta._next_id = 1
         return meta
 
     @staticmethod
     def create_meta(top_level_meta: "Meta",
                     path):
         dataset_id = top_level_meta.dataset_id
-        branch_id = Meta.id_counter
-        Meta.id_counter += 1
-        meta = Meta(path / ".meta.json", dataset_id, branch_id)
+        branch_id = top_level_meta.allocate_id()
+        meta = Meta(path / ".meta.json", dataset_id, branch_id,
+                    author_table=top_level_meta)
         return meta
 
     @staticmethod
-    def from_json(path: Path) -> "Meta":
+    def from_json(path: Path,
+                  top_level_meta: "Meta" = None) -> "Meta":
+        """
+        Read the meta at path, the metas of the nodes of a data-set need the
+        top level meta for their authors
+        """
         text = path.read_text()
-        json_data = json.loads(text)
-        authors = list(map(lambda author_content: Author.from_dict(author_content), json_data["authors"]))
+        meta = Meta.from_dict(json.loads(text), path, top_level_meta)
+        meta._compact = not text.startswith("{\n")
+        return meta
 
-        return Meta(path, int(json_data["dataset_id"]),
+    @staticmethod
+    def from_dict(json_data: Dict,
+                  path: Path,
+                  top_level_meta: "Meta" = None) -> "Meta":
+        if "authors" in json_data:
+            authors = list(map(lambda author_content: Author.from_dict(author_content), json_data["authors"]))
+        else:
+            authors = []
+
+        meta = Meta(path, int(json_data["dataset_id"]),
                     int(json_data["branch_id"]),
-                    json_data["description"], authors)
+                    json_data.get("description", ""), authors,
+                    author_table=top_level_meta)
+        if top_level_meta is not None:
+            # metas written before the authors moved to the top level meta
+            for author in authors:
+                top_level_meta.add_author(author)
+        if "author_ids" in json_data:
+            if top_level_meta is None:
+                raise ValueError("The authors of {:s} are stored in the top level meta".format(str(path)))
+            meta._author_ids = [int(author_id) for author_id in json_data["author_ids"]]
+        if "file_properties" in json_data:
+            meta.add_property(FileProperty.from_dict(json_data["file_properties"]))
+        if "next_branch_id" in json_data:
+            meta._next_id = int(json_data["next_branch_id"])
+        # metas used to hold their complete log
+        meta._log.extend(int(log_id) for log_id in json_data.get("log", []))
+        meta._dirty = False
+        return meta
 
     def add_property(self, node_property: NodeProperty):
         self._additional_properties[node_property.name] = node_property
+        self._dirty = True
 
     def __getitem__(self, name: str) -> NodeProperty:
         return self._additional_properties[name]
 
-    def add_log_entry(self, log_entry):
-        self._log[log_entry.log_id] = log_entry
+    @property
+    def file_properties(self) -> "FileProperty":
+        if "file_properties" not in self._additional_properties:
+            file_properties = FileProperty()
+            file_properties.size = 0
+            file_properties.n_childs = 0
+            self._additional_properties[file_properties.name] = file_properties
+        return self._additional_properties["file_properties"]
+
+    def update_file_properties(self,
+                               size: int = None,
+                               n_childs: int = None) -> None:
+        """
+        Store a new size and number of children, the meta is only changed
+        when they differ from the stored values
+        """
+        file_properties = self.file_properties
+        if size is not None and size != file_properties.size:
+            file_properties.size = size
+            self._dirty = True
+        if n_childs is not None and n_childs != file_properties.n_childs:
+            file_properties.n_childs = n_childs
+            self._dirty = True
+
+    @property
+    def log(self) -> List[int]:
+        """
+        The ids of the last entries of the node in the log of the data-set
+        """
+        return list(self._log)
+
+    def add_log_entry(self, log_entry: LogEntry):
+        self._log.append(log_entry.log_id)
+        self._dirty = True
 
 
 class FileProperty(NodeProperty):
+    """
+    The size in bytes of the data in the leafs of a node, including all its
+    descendants, and the number of children of the node. Both are kept up
+    to date by every write
+    """
 
     def __init__(self):
         # properties
@@ -166,8 +363,8 @@ class FileProperty(NodeProperty):
     @staticmethod
     def from_dict(content: Dict) -> "FileProperty":
         file_property = FileProperty()
-        file_property.size = int(content["size"])
-        file_property.n_childs = int(content["n_childs"])
+        file_property.size = int(content["size"] or 0)
+        file_property.n_childs = int(content["n_childs"] or 0)
         return file_property
 
     def __dict__(self):
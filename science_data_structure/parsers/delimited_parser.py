@@ -0,0 +1,222 @@
+"""
+Import and export of delimited text, csv and tab-separated files, as
+LeafDelimited leafs. The text is parsed in chunks of bytes that end on a
+line, so the memory used does not depend on the size of the file, and the
+chunks can be parsed by a pool of processes. Fields must not hold line
+breaks
+"""
+import csv
+import io
+import os
+import numpy
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from structures import Branch
+from data_formats.text_formats import LeafDelimited
+
+# bytes of text read to guess the dtype of the columns
+sample_size = 2 ** 16
+
+
+def default_delimiter(path: Path) -> str:
+    return "\t" if path.suffix.lower() in (".tsv", ".tab") else ","
+
+
+def byte_ranges(path: Path,
+                start: int,
+                chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split the file from start in ranges of about chunk_size bytes, every
+    range ends after a line break
+    """
+    with path.open("rb") as text_file:
+        text_file.seek(0, io.SEEK_END)
+        size = text_file.tell()
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                text_file.seek(end)
+                text_file.readline()
+                end = text_file.tell()
+            else:
+                end = size
+            yield start, end
+            start = end
+
+
+def guess_dtype(lines: List[str],
+                names: List[str],
+                delimiter: str,
+                quotechar: str = '"') -> numpy.dtype:
+    """
+    A field per column: int64 when all the values are integers, float64
+    when they are numbers and text of the longest value otherwise
+    """
+    rows = [row for row in csv.reader(lines, delimiter=delimiter, quotechar=quotechar) if len(row) > 0]
+    fields = []
+    for i_column, name in enumerate(names):
+        values = [row[i_column].strip() for row in rows if i_column < len(row)]
+        for kind in (int, float):
+            try:
+                for value in values:
+                    kind(value)
+            except ValueError:
+                continue
+            fields += [(name, numpy.int64 if kind is int else numpy.float64)]
+            break
+        else:
+            fields += [(name, "U{:d}".format(max([len(value) for value in values] + [1])))]
+    return numpy.dtype(fields)
+
+
+def parse_range(path: Path,
+                start: int,
+                end: int,
+                delimiter: str,
+                dtype: numpy.dtype,
+                encoding: str = "utf-8",
+                quotechar: str = '"') -> numpy.ndarray:
+    """
+    Parse the lines in a range of bytes of the file. Text columns are
+    parsed as objects first, text that does not fit in its column is an
+    error instead of being cut off
+    """
+    with path.open("rb") as text_file:
+        text_file.seek(start)
+        lines = text_file.read(end - start).decode(encoding).splitlines()
+    lines = [line for line in lines if line.strip() != ""]
+
+    if dtype.names is None:
+        return numpy.loadtxt(lines, delimiter=delimiter, dtype=dtype, quotechar=quotechar, ndmin=2)
+
+    text_fields = [name for name in dtype.names if dtype[name].kind == "U"]
+    parse_dtype = numpy.dtype([(name, object if name in text_fields else dtype[name]) for name in dtype.names])
+    rows = numpy.loadtxt(lines, delimiter=delimiter, dtype=parse_dtype, quotechar=quotechar, ndmin=1)
+    for name in text_fields:
+        width = max(map(len, rows[name]), default=0)
+        if width > dtype[name].itemsize // 4:
+            raise ValueError("Text of {:d} characters does not fit in column {:s} of {:s}, pass the dtype".format(
+                width, name, str(dtype[name])))
+    return rows.astype(dtype)
+
+
+def import_delimited(branch: Branch,
+                     key: str,
+                     path: Path,
+                     delimiter: str = None,
+                     header: bool = True,
+                     dtype=None,
+                     encoding: str = "utf-8",
+                     chunk_size: int = 2 ** 24,
+                     workers: int = None,
+                     executor: Executor = None,
+                     in_flight: int = None,
+                     quotechar: str = '"') -> LeafDelimited:
+    """
+    Import the delimited text at path as a leaf of the branch under key.
+    The delimiter follows from the extension of the file by default and the
+    column names from the header. Without a dtype the dtype of every column
+    is guessed from the start of the file, a plain dtype, like float, gives
+    a 2d array. Every chunk of chunk_size bytes is parsed and written to
+    the leaf before the next one is read. With workers, or an executor, the
+    chunks are parsed by a pool of processes, at most in_flight chunks are
+    parsed or held in memory at once, twice the number of workers by
+    default
+    """
+    path = Path(path)
+    if executor is None and workers is not None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return import_delimited(branch, key, path, delimiter, header, dtype, encoding, chunk_size,
+                                    workers, executor, in_flight, quotechar)
+    if in_flight is None:
+        in_flight = 2 * (workers or os.cpu_count() or 1)
+    if delimiter is None:
+        delimiter = default_delimiter(path)
+
+    with path.open("rb") as text_file:
+        first_line = text_file.readline() if header else b""
+        start = text_file.tell()
+        sample = text_file.read(sample_size).decode(encoding, errors="ignore").splitlines()
+    if dtype is None:
+        # the last line of the sample might be cut off
+        lines = sample[:-1] if len(sample) > 1 else sample
+        n_columns = max([len(row) for row in csv.reader(lines, delimiter=delimiter, quotechar=quotechar)] + [0])
+        header_names = next(csv.reader([first_line.decode(encoding)], delimiter=delimiter, quotechar=quotechar),
+                            []) if header else []
+        names = [(header_names[i_column].strip() if i_column < len(header_names) else "")
+                 or "column_{:d}".format(i_column) for i_column in range(n_columns)]
+        dtype = guess_dtype(lines, names, delimiter, quotechar)
+    dtype = numpy.dtype(dtype)
+
+    leaf = branch.add_leaf(key, leaf_format=LeafDelimited.extension)
+    if executor is None:
+        chunks = (parse_range(path, *byte_range, delimiter, dtype, encoding, quotechar)
+                  for byte_range in byte_ranges(path, start, chunk_size))
+    else:
+        chunks = _parse_parallel(executor, in_flight, path, start, chunk_size, delimiter, dtype, encoding, quotechar)
+
+    n_rows = 0
+    try:
+        for rows in chunks:
+            leaf.append(rows)
+            leaf.flush()
+            n_rows += len(rows)
+    except BaseException:
+        # the partly imported leaf is removed on the next write
+        branch[key] = None
+        raise
+    if n_rows == 0:
+        # an empty table still has its columns
+        leaf.append(numpy.empty((0, ) if dtype.names is not None else (0, 0), dtype=dtype))
+        leaf.flush()
+    return leaf
+
+
+def export_delimited(leaf: LeafDelimited,
+                     path: Path,
+                     delimiter: str = None,
+                     header: bool = True,
+                     batch_size: int = 2 ** 16,
+                     encoding: str = "utf-8",
+                     quotechar: str = '"') -> None:
+    """
+    Write the leaf as delimited text, the rows are streamed in batches of
+    batch_size rows. The header holds the names of the columns, fields
+    holding the delimiter or the quotechar are quoted like import_delimited
+    reads them
+    """
+    path = Path(path)
+    if delimiter is None:
+        delimiter = default_delimiter(path)
+    columns = leaf.columns
+    with path.open("w", encoding=encoding, newline="") as text_file:
+        writer = csv.writer(text_file, delimiter=delimiter, quotechar=quotechar, lineterminator="\n")
+        if header and columns is not None:
+            writer.writerow(columns)
+        for batch in leaf.iter_batches(batch_size):
+            writer.writerows(batch.tolist())
+
+
+# protected functions
+def _parse_parallel(executor: Executor,
+                    in_flight: int,
+                    path: Path,
+                    start: int,
+                    chunk_size: int,
+                    delimiter: str,
+                    dtype: numpy.dtype,
+                    encoding: str,
+                    quotechar: str) -> Iterator[numpy.ndarray]:
+    """
+    The parsed chunks in the order of the file, parsed by the executor with
+    at most in_flight chunks submitted at once
+    """
+    pending = deque()
+    for byte_range in byte_ranges(path, start, chunk_size):
+        pending.append(executor.submit(parse_range, path, *byte_range, delimiter, dtype, encoding, quotechar))
+        if len(pending) >= max(1, in_flight):
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
@@ -1 +1,272 @@
+"""
+Import of MATLAB .mat files as subtrees of a data-set. Structs become
+branches with a node per field, cell arrays and struct arrays branches with
+a node per element (cell_0, cell_1, ...) and numeric, logical and char
+arrays become leafs. Sparse matrices become a branch with their compressed
+column arrays. Files up to version 7 are read with scipy, version 7.3
+files, which are HDF5 files, with h5py. The variables are read in batches
+and every variable is written to disk and released before the next batch is
+read, large arrays of version 7.3 files are copied in slabs without loading
+them as a whole
+"""
+import functools
+import math
+import numpy
+import tempfile
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Iterator, List
+from structures import Branch, StructuredDataSet
 
+try:
+    import scipy.io
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# bytes of a large array copied at once
+slab_size = 2 ** 26
+# bytes of the variables of older files read at once, estimated from their shapes
+batch_size = 2 ** 26
+hdf5_signature = b"\x89HDF\r\n\x1a\n"
+
+
+def is_hdf5(path: Path) -> bool:
+    """
+    Version 7.3 files are HDF5 files, with the signature after the 512 bytes of the MATLAB header
+    """
+    with Path(path).open("rb") as mat_file:
+        for offset in (0, 512):
+            mat_file.seek(offset)
+            if mat_file.read(len(hdf5_signature)) == hdf5_signature:
+                return True
+    return False
+
+
+def import_mat(branch: Branch,
+               path: Path,
+               variables: List[str] = None) -> List[str]:
+    """
+    Import the variables of the .mat file at path into the branch, all the
+    variables by default. The variables are written before the next batch
+    of variables is read, returns the keys of the imported variables
+    """
+    path = Path(path)
+    if is_hdf5(path):
+        if h5py is None:
+            raise ImportError("MATLAB 7.3 files need h5py, install it with pip install h5py")
+        return _import_hdf5(branch, path, variables)
+    if scipy is None:
+        raise ImportError("MATLAB files need scipy, install it with pip install scipy")
+    return _import_matlab(branch, path, variables)
+
+
+def import_mat_files(dataset: StructuredDataSet,
+                     paths: List[Path],
+                     keys: List[str] = None,
+                     workers: int = None,
+                     executor: Executor = None) -> None:
+    """
+    Import many .mat files at once, every file becomes a branch of the
+    data-set, under the name of the file by default. The files are
+    imported by a pool of processes, see StructuredDataSet.build_branches
+    """
+    paths = [Path(path) for path in paths]
+    if keys is None:
+        keys = [path.stem for path in paths]
+    if len(set(keys)) != len(keys):
+        raise KeyError("The keys of the imported files are not unique")
+    dataset.build_branches({key: functools.partial(import_mat, path=path.resolve())
+                            for key, path in zip(keys, paths)},
+                           workers=workers,
+                           executor=executor)
+
+
+# protected functions
+def _write_variable(branch: Branch, key: str) -> None:
+    """
+    Write the imported variable and release its data, data that is not on
+    disk yet is kept
+    """
+    node = branch[key]
+    node.write()
+    leafs = [leaf for path, leaf in node.iter_leaves()] if isinstance(node, Branch) else [node]
+    for leaf in leafs:
+        if not leaf.is_dirty:
+            leaf._unload()
+
+
+def _import_matlab(branch: Branch,
+                   path: Path,
+                   variables: List[str] = None) -> List[str]:
+    shapes = [(name, shape) for name, shape, matlab_class in scipy.io.whosmat(path)
+              if variables is None or name in variables]
+    # every read of the file scans it from the start, a read per variable would scan it once per variable
+    for names in _batches(shapes):
+        values = scipy.io.loadmat(path, variable_names=names, simplify_cells=True)
+        for name in names:
+            _add_value(branch, name, values.pop(name))
+            _write_variable(branch, name)
+        del values
+    return [name for name, shape in shapes]
+
+
+def _batches(shapes: List[tuple]) -> Iterator[List[str]]:
+    """
+    The names of the variables in batches of about batch_size bytes
+    """
+    names = []
+    n_bytes = 0
+    for name, shape in shapes:
+        size = 8 * math.prod(shape)
+        if len(names) > 0 and n_bytes + size > batch_size:
+            yield names
+            names = []
+            n_bytes = 0
+        names += [name]
+        n_bytes += size
+    if len(names) > 0:
+        yield names
+
+
+def _add_value(branch: Branch,
+               key: str,
+               value) -> None:
+    if isinstance(value, dict):
+        child = branch[key]
+        for field, field_value in value.items():
+            _add_value(child, field, field_value)
+    elif scipy is not None and scipy.sparse.issparse(value):
+        _add_sparse(branch, key, value.data, value.indices, value.indptr, value.shape)
+    elif isinstance(value, (list, tuple)) or (isinstance(value, numpy.ndarray) and value.dtype == object):
+        child = branch[key]
+        for i_cell, cell in enumerate(numpy.asarray(value, dtype=object).flat):
+            _add_value(child, "cell_{:d}".format(i_cell), cell)
+    elif isinstance(value, (numpy.ndarray, numpy.generic, str, bytes, bool, int, float, complex)):
+        branch[key] = numpy.asarray(value)
+    else:
+        raise TypeError("The MATLAB value {:s} of type {:s} can not be imported".format(key, type(value).__name__))
+
+
+def _add_sparse(branch: Branch,
+                key: str,
+                data: numpy.ndarray,
+                indices: numpy.ndarray,
+                indptr: numpy.ndarray,
+                shape: tuple) -> None:
+    child = branch[key]
+    child["data"] = numpy.asarray(data)
+    child["indices"] = numpy.asarray(indices)
+    child["indptr"] = numpy.asarray(indptr)
+    child["shape"] = numpy.asarray(shape)
+
+
+def _import_hdf5(branch: Branch,
+                 path: Path,
+                 variables: List[str] = None) -> List[str]:
+    names = []
+    dataset = branch.dataset
+    dataset.path.mkdir(parents=True, exist_ok=True)
+    with h5py.File(path, "r") as mat_file:
+        for name, item in mat_file.items():
+            if name.startswith("#") or (variables is not None and name not in variables):
+                continue
+            # large arrays are copied to memory-maps next to the data-set until they are written
+            with tempfile.TemporaryDirectory(dir=dataset.path, prefix=".mat_") as directory:
+                _add_hdf5(branch, name, item, mat_file, Path(directory))
+                _write_variable(branch, name)
+            names += [name]
+    return names
+
+
+def _add_hdf5(branch: Branch,
+              key: str,
+              item,
+              mat_file,
+              directory: Path) -> None:
+    matlab_class = item.attrs.get("MATLAB_class", "")
+    if isinstance(matlab_class, bytes):
+        matlab_class = matlab_class.decode()
+    if isinstance(item, h5py.Group):
+        if "MATLAB_sparse" in item.attrs:
+            if "data" in item:
+                data, indices = item["data"][()], item["ir"][()]
+            else:
+                data, indices = numpy.zeros(0), numpy.zeros(0, dtype=numpy.uint64)
+            _add_sparse(branch, key, _complex(data), indices, item["jc"][()],
+                        (int(item.attrs["MATLAB_sparse"]), len(item["jc"]) - 1))
+            return
+        child = branch[key]
+        if _is_struct_array(item):
+            # a node per element like scipy gives for the older files, the fields hold references to the values
+            references = {field: field_item[()].T.flat for field, field_item in item.items()}
+            n_elements = min(field_item.size for field_item in item.values())
+            for i_element in range(n_elements):
+                element = child["cell_{:d}".format(i_element)]
+                for field, field_references in references.items():
+                    _add_hdf5(element, field, mat_file[field_references[i_element]], mat_file, directory)
+            return
+        for field, field_item in item.items():
+            _add_hdf5(child, field, field_item, mat_file, directory)
+        return
+
+    if item.dtype == h5py.ref_dtype:
+        # cell arrays and the fields of struct arrays hold references to their elements
+        child = branch[key]
+        for i_cell, reference in enumerate(item[()].T.flat):
+            _add_hdf5(child, "cell_{:d}".format(i_cell), mat_file[reference], mat_file, directory)
+        return
+
+    # the arrays are squeezed like scipy does for the older files
+    if matlab_class == "char":
+        text = "" if item.attrs.get("MATLAB_empty", 0) else "".join(map(chr, item[()].T.flat))
+        branch[key] = numpy.asarray(text)
+    elif item.attrs.get("MATLAB_empty", 0):
+        # the data of an empty array is its shape
+        dtype = bool if matlab_class == "logical" else numpy.float64
+        branch[key] = numpy.squeeze(numpy.zeros(tuple(int(n) for n in item[()].flat), dtype=dtype))
+    elif item.dtype.names is not None or item.nbytes <= slab_size:
+        value = numpy.squeeze(_complex(item[()]).T)
+        branch[key] = value.astype(bool) if matlab_class == "logical" else value
+    else:
+        branch[key] = numpy.squeeze(_copy_slabs(item, directory / "{:s}.npy".format(key)))
+
+
+def _is_struct_array(group) -> bool:
+    """
+    The fields of a struct array are arrays of references without a MATLAB
+    class, a cell array in a single struct has the class cell
+    """
+    fields = list(group.values())
+    return len(fields) > 0 and all(isinstance(field, h5py.Dataset) and field.dtype == h5py.ref_dtype
+                                   and "MATLAB_class" not in field.attrs for field in fields)
+
+
+def _complex(value: numpy.ndarray) -> numpy.ndarray:
+    if value.dtype.names is not None and set(value.dtype.names) == {"real", "imag"}:
+        return value["real"] + 1j * value["imag"]
+    return value
+
+
+def _copy_slabs(item, path: Path) -> numpy.memmap:
+    """
+    Copy a large array to a memory-map, slab by slab. HDF5 holds the
+    transposed MATLAB array, the map is the array in fortran order
+    """
+    shape = item.shape
+    array = numpy.lib.format.open_memmap(path,
+                                         mode="w+",
+                                         dtype=item.dtype,
+                                         shape=shape[::-1],
+                                         fortran_order=True)
+    row_bytes = item.dtype.itemsize * math.prod(shape[1:])
+    n_rows = max(1, slab_size // max(1, row_bytes))
+    for start in range(0, shape[0], n_rows):
+        array.T[start:start + n_rows] = item[start:start + n_rows]
+    array.flush()
+    return array
@@ -0,0 +1,96 @@
+import csv
+import shutil
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from concurrent.futures import ThreadPoolExecutor
+from author import Author
+from data_formats.text_formats import LeafDelimited
+from parsers import delimited_parser
+
+
+class TestDelimitedParser(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_delimited_parser")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_import_export(self):
+        shutil.rmtree(self._test_path / "delimited.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "delimited",
+                                                   self._author)
+        path = self._test_path / "export.csv"
+        with path.open("w") as text_file:
+            text_file.write("time,voltage,label\n")
+            for i_row in range(1000):
+                text_file.write("{:d},{:.3f},run_{:d}\n".format(i_row, i_row / 7, i_row % 10))
+
+        # small chunks, parsed in parallel
+        leaf = delimited_parser.import_delimited(dataset["runs"], "export", path, chunk_size=1024, workers=2)
+        self.assertIsInstance(leaf, LeafDelimited)
+        self.assertEqual(leaf.columns, ["time", "voltage", "label"])
+        self.assertEqual(leaf.shape, (1000, ))
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, mmap_mode="r")
+        leaf = dataset_read["runs"]["export"]
+        self.assertIsInstance(leaf, LeafDelimited)
+        self.assertTrue(numpy.all(leaf.column("time") == numpy.arange(1000)))
+        self.assertAlmostEqual(leaf.column("voltage")[700], 100.0)
+        self.assertEqual(leaf.column("label")[13], "run_3")
+
+        path_tsv = self._test_path / "export.tsv"
+        delimited_parser.export_delimited(leaf, path_tsv, batch_size=100)
+        lines = path_tsv.read_text().splitlines()
+        self.assertEqual(lines[0], "time\tvoltage\tlabel")
+        self.assertEqual(lines[8], "7\t1.0\trun_7")
+        self.assertEqual(len(lines), 1001)
+
+        # text longer than the guessed width is an error instead of being cut off
+        with path.open("a") as text_file:
+            text_file.write("1000,0.0,{:s}\n".format("x" * 100))
+        with self.assertRaisesRegex(ValueError, "does not fit"):
+            delimited_parser.import_delimited(dataset, "long", path, chunk_size=1024)
+        self.assertNotIn("long", dataset.keys())
+
+    def test_quoted(self):
+        shutil.rmtree(self._test_path / "delimited_quoted.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "delimited_quoted",
+                                                   self._author)
+        rows = [[str(i_row), 'say "{:d}", twice'.format(i_row)] for i_row in range(100)]
+        path = self._test_path / "quoted.csv"
+        with path.open("w", newline="") as text_file:
+            writer = csv.writer(text_file)
+            writer.writerow(["id", "comment"])
+            writer.writerows(rows)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leaf = delimited_parser.import_delimited(dataset, "quoted", path, chunk_size=256,
+                                                     executor=executor, in_flight=1)
+        self.assertEqual(leaf.column("comment")[7], 'say "7", twice')
+
+        path_export = self._test_path / "quoted_export.csv"
+        delimited_parser.export_delimited(leaf, path_export, batch_size=30)
+        with path_export.open(newline="") as text_file:
+            self.assertEqual(list(csv.reader(text_file)), [["id", "comment"]] + rows)
+        leaf = delimited_parser.import_delimited(dataset, "quoted_export", path_export)
+        self.assertTrue(numpy.all(leaf.data == dataset["quoted"].data))
+
+    def test_plain_dtype(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "delimited_plain",
+                                                   self._author)
+        path = self._test_path / "matrix.tsv"
+        numpy.savetxt(path, numpy.arange(30).reshape((10, 3)), delimiter="\t")
+        leaf = delimited_parser.import_delimited(dataset, "matrix", path, header=False, dtype=float)
+        self.assertEqual(leaf.shape, (10, 3))
+        self.assertIsNone(leaf.columns)
+        self.assertTrue(numpy.all(leaf.data == numpy.arange(30).reshape((10, 3))))
+
+
+if __name__ == "__main__":
+    unittest.main()
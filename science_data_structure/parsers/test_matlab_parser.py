@@ -0,0 +1,159 @@
+import shutil
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+from data_formats.packed_formats import LeafPacked
+from parsers import matlab_parser
+
+
+@unittest.skipIf(matlab_parser.scipy is None, "scipy is not installed")
+class TestMatlabParser(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_matlab_parser")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def write_mat(self, path: Path, offset: int) -> None:
+        cells = numpy.empty((1, 2), dtype=object)
+        cells[0, 0] = numpy.arange(3) + offset
+        cells[0, 1] = "text"
+        structs = numpy.zeros((1, 2), dtype=[("value", object), ("name", object)])
+        structs[0, 0] = (1.0, "first")
+        structs[0, 1] = (2.0, "second")
+        matlab_parser.scipy.io.savemat(path, {
+            "experiment": {"voltage": numpy.linspace(0, 1, 11) + offset,
+                           "settings": {"gain": 2.5, "name": "probe"}},
+            "cells": cells,
+            "structs": structs,
+            "matrix": numpy.arange(6).reshape((2, 3)),
+            "sparse": matlab_parser.scipy.sparse.eye(3).tocsc()
+        })
+
+    def test_import(self):
+        shutil.rmtree(self._test_path / "matlab.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "matlab",
+                                                   self._author)
+        path = self._test_path / "session.mat"
+        self.write_mat(path, 0)
+        self.assertFalse(matlab_parser.is_hdf5(path))
+        # the small variables are read at once, the large ones on their own
+        batch_size = matlab_parser.batch_size
+        matlab_parser.batch_size = 64
+        try:
+            keys = matlab_parser.import_mat(dataset["session"], path)
+        finally:
+            matlab_parser.batch_size = batch_size
+        self.assertEqual(sorted(keys), ["cells", "experiment", "matrix", "sparse", "structs"])
+        dataset.write()
+
+        session = StructuredDataSet.open_dataset(dataset.path)["session"]
+        self.assertTrue(numpy.all(session["experiment"]["voltage"].data == numpy.linspace(0, 1, 11)))
+        self.assertEqual(float(session["experiment"]["settings"]["gain"].data), 2.5)
+        self.assertEqual(str(session["experiment"]["settings"]["name"].data), "probe")
+        self.assertTrue(numpy.all(session["cells"]["cell_0"].data == numpy.arange(3)))
+        self.assertEqual(str(session["cells"]["cell_1"].data), "text")
+        self.assertTrue(numpy.all(session["matrix"].data == numpy.arange(6).reshape((2, 3))))
+        self.assertEqual(list(session["sparse"]["shape"].data), [3, 3])
+        self.assertEqual(float(session["structs"]["cell_1"]["value"].data), 2.0)
+        self.assertEqual(str(session["structs"]["cell_1"]["name"].data), "second")
+
+    def test_batch(self):
+        shutil.rmtree(self._test_path / "matlab_batch.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "matlab_batch",
+                                                   self._author)
+        paths = [self._test_path / "run_{:d}.mat".format(i_file) for i_file in range(4)]
+        for i_file, path in enumerate(paths):
+            self.write_mat(path, i_file)
+        # the small arrays are packed by the workers
+        dataset.pack_size = 1024
+        matlab_parser.import_mat_files(dataset, paths, workers=2)
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(sorted(dataset_read.keys()), ["run_0", "run_1", "run_2", "run_3"])
+        self.assertTrue(numpy.all(dataset_read["run_3"]["cells"]["cell_0"].data == numpy.arange(3) + 3))
+        self.assertIsInstance(dataset_read["run_3"]["matrix"], LeafPacked)
+
+    def test_packed(self):
+        shutil.rmtree(self._test_path / "matlab_packed.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "matlab_packed",
+                                                   self._author)
+        dataset.pack_size = 1024
+        path = self._test_path / "scalars.mat"
+        matlab_parser.scipy.io.savemat(path, {"x": numpy.arange(4.0), "gain": 2.5, "large": numpy.zeros(1000)})
+        self.assertEqual(sorted(matlab_parser.import_mat(dataset, path)), ["gain", "large", "x"])
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertIsInstance(dataset_read["x"], LeafPacked)
+        self.assertTrue(numpy.all(dataset_read["x"].data == numpy.arange(4.0)))
+        self.assertEqual(float(dataset_read["gain"].data), 2.5)
+        self.assertEqual(dataset_read["large"].shape, (1000, ))
+
+    @unittest.skipIf(matlab_parser.h5py is None, "h5py is not installed")
+    def test_hdf5(self):
+        shutil.rmtree(self._test_path / "matlab_hdf5.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "matlab_hdf5",
+                                                   self._author)
+        # a version 7.3 file as written by MATLAB, the arrays are stored transposed
+        h5py = matlab_parser.h5py
+        path = self._test_path / "session_73.mat"
+        large = numpy.arange(5000.0).reshape((50, 100))
+        with h5py.File(path, "w", userblock_size=512) as mat_file:
+            experiment = mat_file.create_group("experiment")
+            experiment.attrs["MATLAB_class"] = numpy.bytes_("struct")
+            experiment.create_dataset("large", data=large.T).attrs["MATLAB_class"] = numpy.bytes_("double")
+            name = experiment.create_dataset("name", data=numpy.array([[ord(c)] for c in "probe"], dtype=numpy.uint16))
+            name.attrs["MATLAB_class"] = numpy.bytes_("char")
+            references = mat_file.create_group("#refs#")
+            element = references.create_dataset("a", data=numpy.arange(3.0)[:, numpy.newaxis])
+            element.attrs["MATLAB_class"] = numpy.bytes_("double")
+            cells = mat_file.create_dataset("cells", data=numpy.array([[element.ref]]), dtype=h5py.ref_dtype)
+            cells.attrs["MATLAB_class"] = numpy.bytes_("cell")
+            # the fields of a struct array hold references to the values of the elements
+            structs = mat_file.create_group("structs")
+            structs.attrs["MATLAB_class"] = numpy.bytes_("struct")
+            values, names = [], []
+            for i_element, text in enumerate(["first", "second"]):
+                value = references.create_dataset("v{:d}".format(i_element), data=[[i_element + 1.0]])
+                value.attrs["MATLAB_class"] = numpy.bytes_("double")
+                name = references.create_dataset("n{:d}".format(i_element),
+                                                 data=numpy.array([[ord(c)] for c in text], dtype=numpy.uint16))
+                name.attrs["MATLAB_class"] = numpy.bytes_("char")
+                values += [value.ref]
+                names += [name.ref]
+            structs.create_dataset("value", data=numpy.array([values]).T, dtype=h5py.ref_dtype)
+            structs.create_dataset("name", data=numpy.array([names]).T, dtype=h5py.ref_dtype)
+        with path.open("r+b") as mat_file:
+            mat_file.write(b"MATLAB 7.3 MAT-file".ljust(128))
+        self.assertTrue(matlab_parser.is_hdf5(path))
+
+        # copy the large array in slabs of 8 columns
+        slab_size = matlab_parser.slab_size
+        matlab_parser.slab_size = 8 * 50 * 8
+        try:
+            keys = matlab_parser.import_mat(dataset, path)
+        finally:
+            matlab_parser.slab_size = slab_size
+        self.assertEqual(sorted(keys), ["cells", "experiment", "structs"])
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_read["experiment"]["large"].data == large))
+        self.assertEqual(str(dataset_read["experiment"]["name"].data), "probe")
+        self.assertTrue(numpy.all(dataset_read["cells"]["cell_0"].data == numpy.arange(3.0)))
+        # the same layout as the struct arrays of the older files
+        self.assertEqual(float(dataset_read["structs"]["cell_1"]["value"].data), 2.0)
+        self.assertEqual(str(dataset_read["structs"]["cell_1"]["name"].data), "second")
+        self.assertEqual([path.name for path in dataset.path.iterdir() if path.name.startswith(".mat_")], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+from typing import Dict, List, Tuple
+
+
+class IOStats:
+    """
+    Time and bytes spent in the disk operations of a data-set, per node and
+    per operation. The operations are "meta" (serializing a meta), "makedirs",
+    "write" and "read" (the data of a leaf), "remove" and "open" (creating
+    the nodes of a branch from disk). The stats are only collected when they
+    are enabled on the data-set
+    """
+
+    def __init__(self) -> None:
+        self._operations = {}  # type: Dict[str, List]
+        self._nodes = {}  # type: Dict[str, Dict[str, List]]
+        self._lock = threading.Lock()
+
+    def record(self,
+               node: str,
+               operation: str,
+               seconds: float,
+               n_bytes: int = 0) -> None:
+        """
+        Add an operation on the node at the path relative to the data-set
+        """
+        with self._lock:
+            for totals in (self._operations, self._nodes.setdefault(node, {})):
+                total = totals.setdefault(operation, [0, 0.0, 0])
+                total[0] += 1
+                total[1] += seconds
+                total[2] += n_bytes
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations = {}
+            self._nodes = {}
+
+    @property
+    def operations(self) -> Dict[str, Dict]:
+        """
+        Count, time and bytes of every operation over the data-set
+        """
+        with self._lock:
+            return {operation: self._total(total) for operation, total in self._operations.items()}
+
+    @property
+    def nodes(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        Count, time and bytes of every operation per node
+        """
+        with self._lock:
+            return {node: {operation: self._total(total) for operation, total in operations.items()}
+                    for node, operations in self._nodes.items()}
+
+    def slowest(self, n_nodes: int = 10) -> List[Tuple[str, float]]:
+        """
+        The nodes that took the most time
+        """
+        with self._lock:
+            times = [(node, sum(total[1] for total in operations.values()))
+                     for node, operations in self._nodes.items()]
+        return sorted(times, key=lambda node_time: node_time[1], reverse=True)[:n_nodes]
+
+    def report(self, n_nodes: int = 10) -> str:
+        line = "{:<10s} {:>10s} {:>12s} {:>12s} {:>10s}\n".format("operation", "count", "time [s]", "MB", "MB/s")
+        for operation, total in sorted(self.operations.items()):
+            mb = total["bytes"] / 2 ** 20
+            line += "{:<10s} {:10d} {:12.4f} {:12.2f} {:10.1f}\n".format(
+                operation, total["count"], total["time"], mb, mb / total["time"] if total["time"] > 0 else 0.0)
+        slowest = self.slowest(n_nodes)
+        if len(slowest) > 0:
+            line += "\nslowest nodes\n"
+            for node, seconds in slowest:
+                line += "{:12.4f} {:s}\n".format(seconds, node)
+        return line
+
+    def __str__(self) -> str:
+        return self.report()
+
+    # protected functions
+    @staticmethod
+    def _total(total: List) -> Dict:
+        return {"count": total[0], "time": total[1], "bytes": total[2]}
@@ -1,11 +1,24 @@
 import abc
-from typing import Dict, List
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Tuple
+from collections import deque
+import asyncio
+import fnmatch
+import functools
 from pathlib import Path
 import os
+import threading
+import weakref
 from meta import Meta
 from config import ConfigManager
 import logger as logger
+from logger import ChangeLog
 from author import Author
+from writer import Writer, TransactionalWriter
+from catalog import Catalog
+from consolidated import ConsolidatedMeta
+from cache import LeafCache
+from stats import IOStats
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 class Node:
@@ -17,6 +30,10 @@ class Node:
         self._parent = parent
         self._meta = meta
         self._name = name
+        self._dirty = True
+        # nodes never move, their path and data-set are looked up once
+        self._cached_path = None  # type: Path
+        self._dataset = None  # type: StructuredDataSet
 
     @property
     def name(self) -> str:
@@ -24,10 +41,12 @@ class Node:
 
     @property
     def path(self) -> Path:
-        return self._parent.path / self.name
+        if self._cached_path is None:
+            self._cached_path = self._parent.path / self.name
+        return self._cached_path
 
     @abc.abstractmethod
-    def write(self) -> "None":
+    def write(self, writer: Writer = None) -> "None":
         raise NotImplementedError("write functions must be overwritten")
 
     @abc.abstractmethod
@@ -38,11 +57,61 @@ class Node:
     def meta(self):
         return self._meta
 
+    @property
+    def is_dirty(self) -> bool:
+        """
+        True when the node itself (not its children) differs from what is on disk
+        """
+        return self._dirty or self._meta.is_dirty
+
+    @property
+    def size(self) -> int:
+        """
+        Size in bytes of the data in the node, including all its descendants
+        """
+        return self._meta.file_properties.size
+
+    def _exists_on_disk(self) -> bool:
+        return self.path.exists()
+
+    @logger.instrument("makedirs")
+    def _makedirs(self, writer: Writer) -> None:
+        writer.makedirs(self.path)
+
+    def _write_ancestor_metas(self, writer: Writer) -> None:
+        """
+        Write the metas of the ancestors changed by writing this node on its
+        own, like their sizes
+        """
+        branch = self._parent
+        while branch is not None:
+            if branch.meta.is_dirty:
+                branch.meta.write(writer)
+            branch = branch._parent
+
+    @logger.instrument("remove", lambda node, result, writer: node.size)
+    def _remove_from_disk(self, writer: Writer = None) -> None:
+        if writer is None:
+            self.remove()
+        else:
+            writer.remove(self)
+
+    def set_dirty(self) -> None:
+        """
+        Force the node to be written on the next write, for example after
+        changing the data of a leaf in place
+        """
+        self._dirty = True
+
+    @property
+    def dataset(self) -> "StructuredDataSet":
+        if self._dataset is None:
+            self._dataset = self if isinstance(self, StructuredDataSet) else self._parent.dataset
+        return self._dataset
+
     @property
     def top_level_meta(self) -> Meta:
-        if isinstance(self, StructuredDataSet):
-            return self.meta
-        return self._parent.top_level_meta
+        return self.dataset.meta
 
 
 class Branch(Node):
@@ -54,102 +123,492 @@ class Branch(Node):
                  meta: Meta) -> None:
         super().__init__(parent, meta, name)
         self._content = content  # type: Dict[str, Node]
+        self._lazy_content = {}  # type: Dict[str, Path]
+        self._is_listed = True
         self._kill = []  # type: List[Node]
+        self._pack = None
+        # listing and loading the children from concurrent threads, see awalk
+        self._load_lock = threading.RLock()
 
-    @logger.logger
-    def write(self) -> None:
-        os.makedirs(self.path, exist_ok=True)
-        self._meta.write()
-        for node_name in self._content.keys():
-            self._content[node_name].write()
+    def write(self, writer: Writer = None) -> None:
+        """
+        Write the branch incrementally, only the nodes that changed since the
+        last read or write are written to disk
+        """
+        if writer is None:
+            writer = Writer()
+            self.write(writer)
+            writer.defer(self._write_ancestor_metas, writer)
+            writer.finish()
+            self.dataset._after_write(writer)
+            return
 
-        # empty the kill ring
-        for node_kill in self._kill:
-            node_kill.remove()
-        self._kill = []
+        # empty the kill ring first, a replaced node can share its path with the new node
+        self._clear_kill(writer)
+
+        if self.is_dirty:
+            self._makedirs(writer)
+
+        for node in self._content.values():
+            node.write(writer)
+        if self._pack is not None and self._pack.dirty:
+            self._pack.write(writer)
 
-    def read(self) -> "Branch":
-        content = list(self.path.glob("./*"))
-        content = list(filter(lambda x: not x.stem.startswith("."), content))
-        branches = list(filter(lambda x: x.suffix != ".leaf", content))
-        data = list(filter(lambda x: x.suffix == ".leaf", content))
+        # the meta holds the size of the children, it is written once they are
+        writer.defer(self._finish_write, writer)
 
-        for branch in branches:
-            self._content[branch.name] = Branch(self,
-                                                branch.name,
-                                                {},
-                                                Meta.from_json(self.path / branch.name / ".meta.json"))
-            self._content[branch.name].read()
+    def _finish_write(self, writer: Writer) -> None:
+        if self._dirty:
+            self._meta.update_file_properties(n_childs=len(self._content) + len(self._lazy_content))
+        if self.is_dirty:
+            self._write_meta(writer)
+            writer.node_written(self)
+            self._dirty = False
 
-        for data_node in data:
-            self._content[data_node.with_suffix("").name] = Leaf.initialize(self,
-                                                                            data_node.with_suffix("").name)
+    # the meta is only written for changed branches, which logs their writes
+    @logger.logger(action="write")
+    @logger.instrument("meta", lambda node, result, writer: result)
+    def _write_meta(self, writer: Writer) -> int:
+        return self._meta.write(writer)
+
+    def read(self,
+             lazy: bool = False,
+             executor: Executor = None) -> "Branch":
+        """
+        Read the content of the branch from disk. When lazy is set the
+        content is only listed, and the metas are only parsed, once a child
+        is accessed through keys or __getitem__. With an executor sibling
+        branches are read concurrently
+        """
+        self._is_listed = False
+        if not lazy:
+            if executor is None:
+                pending = [self]
+                while len(pending) > 0:
+                    pending += pending.pop()._read_level()
+            else:
+                futures = {executor.submit(self._read_level)}
+                while len(futures) > 0:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for branch in future.result():
+                            futures.add(executor.submit(branch._read_level))
+        self._dirty = False
+        return self
 
     def keys(self) -> List[str]:
-        return list(self._content.keys())
+        with self._load_lock:
+            self._list_content()
+            return list(self._content.keys()) + list(self._lazy_content.keys())
 
     def remove(self) -> None:
+        self._load_all()
         for key in self._content.keys():
             self._content[key].remove()
 
         self.meta.path.unlink()
         self._clear_kill()
+        if self.pack.path.exists():
+            self.pack.path.unlink()
         self.path.rmdir()
 
     # protected functions
+    def _list_content(self) -> None:
+        """
+        List the children on disk without creating the nodes
+        """
+        if self._is_listed:
+            return
+        with self._load_lock:
+            if not self._is_listed:
+                self._list_children()
+
+    def _list_children(self) -> None:
+        self._is_listed = True
+        catalog = self.dataset.catalog
+        if catalog is not None:
+            parent = self.path.relative_to(self.dataset.path).as_posix()
+            for name, kind in catalog.children("" if parent == "." else parent):
+                key = name[:-5] if kind == "leaf" else name
+                if key not in self._content:
+                    self._lazy_content[key] = self.path / name
+            if self.pack.path.exists():
+                self._list_pack()
+            return
+
+        try:
+            entries = os.scandir(self.path)
+        except FileNotFoundError:
+            # the branch is not written yet
+            return
+        # the type of a directory entry comes with the listing, no extra stat is needed
+        has_pack = False
+        with entries:
+            for entry in entries:
+                if entry.name == ".pack":
+                    has_pack = True
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                key = entry.name[:-5] if entry.name.endswith(".leaf") else entry.name
+                if key not in self._content:
+                    self._lazy_content[key] = Path(entry.path)
+        if has_pack:
+            self._list_pack()
+
+    def _list_pack(self) -> None:
+        """
+        List the leafs in the pack of the branch
+        """
+        for key in self.pack.keys():
+            if key not in self._content:
+                self._lazy_content[key] = self.pack.path
+
+    @logger.instrument("open")
+    def _load_node(self, key: str) -> Node:
+        """
+        Create the node of a listed child
+        """
+        path = self._lazy_content.pop(key)
+        if path.name == ".pack":
+            from data_formats.packed_formats import LeafPacked
+            node = LeafPacked.from_pack(self, key)
+        elif path.suffix == ".leaf":
+            node = Leaf.initialize(self, key)
+        else:
+            node = Branch(self,
+                          key,
+                          {},
+                          Meta.from_json(path / ".meta.json", self.top_level_meta))
+            node.read(lazy=True)
+        self._content[key] = node
+        return node
+
+    def _load_all(self) -> None:
+        with self._load_lock:
+            self._list_content()
+            for key in list(self._lazy_content.keys()):
+                self._load_node(key)
+
+    def _read_level(self) -> List["Branch"]:
+        """
+        Load all the children of the branch and return the child branches
+        """
+        self._load_all()
+        return [node for node in self._content.values() if isinstance(node, Branch)]
+
+    def _get_node(self, key: str) -> Node:
+        """
+        Return the child with the given key, or None when it does not exist
+        """
+        if key in self._content:
+            return self._content[key]
+        with self._load_lock:
+            if key in self._content:
+                # loaded by another thread meanwhile
+                return self._content[key]
+            self._list_content()
+            if key in self._lazy_content:
+                return self._load_node(key)
+        return None
+
     def _remove_item(self, key: str) -> Node:
-        self._kill += [self._content[key]]
+        node = self._get_node(key)
+        if node is None:
+            raise KeyError(key)
+        self._kill += [node]
+        self._dirty = True
         return self._content.pop(key)
 
-    def _clear_kill(self) -> None:
+    def _clear_kill(self, writer: Writer = None) -> None:
         for node in self._kill:
-            node._remove()
-            self._kill.remove(node)
-        for branch in self.branches:
-            branch._clear_kill()
+            # nodes that were never written do not have to be removed from disk
+            if node._exists_on_disk():
+                node._remove_from_disk(writer)
+                if writer is not None:
+                    self._add_size(-node.size)
+            if isinstance(node, Leaf) and self.dataset.cache is not None:
+                self.dataset.cache.discard(node)
+        self._kill = []
+
+    def _add_size(self, size: int) -> None:
+        """
+        Add to the size of the branch and all its ancestors
+        """
+        if size == 0:
+            return
+        branch = self
+        while branch is not None:
+            branch.meta.update_file_properties(size=branch.size + size)
+            branch = branch._parent
 
     def __getitem__(self, name: str) -> Node:
-        try:
-            return self._content[name]
-        except KeyError:
-            self._content[name] = Branch.create_branch(self, name)
-            return self._content[name]
+        """
+        The child with the name, a missing child is created as a branch. The
+        name can be a path like "a/b/c", missing branches on the way are
+        created as well
+        """
+        self._check_path(name)
+        if "/" in name:
+            parent_path, name = name.rsplit("/", 1)
+            return self._get_branch(parent_path)[name]
+        node = self._get_node(name)
+        if node is None:
+            node = Branch.create_branch(self, name)
+            self._content[name] = node
+            self._dirty = True
+        return node
 
     def __setitem__(self, key: str, item) -> None:
-        if not isinstance(key, str):
-            raise KeyError
+        self._check_path(key)
+        if "/" in key:
+            parent_path, key = key.rsplit("/", 1)
+            self._get_branch(parent_path)[key] = item
+            return
         if item is None:
             self._remove_item(key)
-        elif not isinstance(item, Node):
-            if key in self._content:
-                self._kill += [self._content[key]]
-            import data_formats
-            self._content[key] = data_formats.available_types[type(item)](self,
-                                                                          "{:s}.leaf".format(key),
-                                                                          Meta.create_meta(self.top_level_meta,
-                                                                                           self.path / "{:s}.leaf/".format(key)))
-            self._content[key].data = item
+            return
+
+        if not isinstance(item, Node):
+            self.add_leaf(key, item)
+            return
+
+        node = self._get_node(key)
+        if node is not None:
+            self._kill += [node]
+        self._content[key] = item
+        self._dirty = True
+
+    def update(self,
+               items: Dict[str, object]) -> None:
+        """
+        Assign many nodes at once, the keys are paths like "a/b/c" relative
+        to the branch. The branches on the way are looked up, or created,
+        once for all the items below them
+        """
+        branches = {"": self}
+        for path, item in items.items():
+            self._check_path(path)
+            parent_path, _, key = path.rpartition("/")
+            parent = branches.get(parent_path)
+            if parent is None:
+                parent = self._get_branch(parent_path, branches)
+            parent[key] = item
+
+    @staticmethod
+    def _check_path(path: str) -> None:
+        """
+        A path is one or more keys joined by slashes, empty keys, like in
+        "/a", "a/" or "a//b", are not allowed
+        """
+        if not isinstance(path, str) or "" in path.split("/"):
+            raise KeyError("{!r} is not a valid path".format(path))
+
+    def _get_branch(self,
+                    path: str,
+                    branches: Dict[str, "Branch"] = None) -> "Branch":
+        """
+        The branch at the path relative to this branch, missing branches are
+        created. Branches found on the way are added to branches by path
+        """
+        branch = self
+        prefix = ""
+        for key in path.split("/"):
+            prefix = key if prefix == "" else prefix + "/" + key
+            node = branches.get(prefix) if branches is not None else None
+            if node is None:
+                node = branch[key]
+                if not isinstance(node, Branch):
+                    raise KeyError("{:s} is not a branch".format(prefix))
+                if branches is not None:
+                    branches[prefix] = node
+            branch = node
+        return branch
+
+    def add_leaf(self,
+                 key: str,
+                 data=None,
+                 leaf_format: str = None) -> "Leaf":
+        """
+        Add a leaf to the branch, an existing node with the same key is
+        replaced. The leaf_format is an extension from
+        data_formats.available_extensions, by default the format follows from
+        the type of the data
+        """
+        import data_formats
+        if leaf_format is None:
+            leaf_type = data_formats.available_types[type(data)]
+            pack_size = self.dataset.pack_size
+            if leaf_type is data_formats.general_formats.LeafNumpy:
+                # small arrays go to the pack of the branch, the others are
+                # stored in the format chosen for the data-set
+                if pack_size is not None and data.nbytes <= pack_size:
+                    leaf_type = data_formats.packed_formats.LeafPacked
+                elif self.dataset.array_format is not None:
+                    leaf_type = data_formats.available_extensions[self.dataset.array_format]
         else:
-            if key not in self._content:
-                self._content[key] = item
-            else:
-                self._kill += [self._content[key]]
-                self._content[key] = item
+            leaf_type = data_formats.available_extensions[leaf_format]
+
+        node = self._get_node(key)
+        if node is not None:
+            self._kill += [node]
+        leaf = leaf_type(self,
+                         "{:s}.leaf".format(key),
+                         Meta.create_meta(self.top_level_meta,
+                                          self.path / "{:s}.leaf/".format(key)))
+        if data is not None:
+            leaf.data = data
+        self._content[key] = leaf
+        self._dirty = True
+        return leaf
 
     @property
     def name(self) -> str:
         return self._name
 
+    @property
+    def pack(self):
+        """
+        The container of the packed leafs of the branch, see data_formats.packed_formats
+        """
+        if self._pack is None:
+            from data_formats.packed_formats import Pack
+            self._pack = Pack(self)
+        return self._pack
+
     @property
     def branches(self) -> List["Branch"]:
+        self._load_all()
         return list(filter(lambda content: isinstance(content, Branch),
                            self._content.values()))
 
     @property
     def leafs(self) -> List["Leaf"]:
+        self._load_all()
         return list(filter(lambda content: isinstance(content, Leaf),
                            self._content.values()))
 
+    def walk(self,
+             depth_first: bool = True) -> Iterator[Tuple[str, Node]]:
+        """
+        Stream all the nodes below the branch as (path, node) pairs, the path
+        is relative to the branch. Depth first every node comes before its
+        children, breadth first level by level. Nodes are loaded as they are
+        reached, the data of the leafs is not read
+        """
+        if not depth_first:
+            pending = deque([("", self)])
+            while len(pending) > 0:
+                prefix, branch = pending.popleft()
+                for key in branch.keys():
+                    node = branch._get_node(key)
+                    yield prefix + key, node
+                    if isinstance(node, Branch):
+                        pending.append((prefix + key + "/", node))
+            return
+
+        stack = [("", self, iter(self.keys()))]
+        while len(stack) > 0:
+            prefix, branch, keys = stack[-1]
+            key = next(keys, None)
+            if key is None:
+                stack.pop()
+                continue
+            node = branch._get_node(key)
+            if node is None:
+                # removed while walking
+                continue
+            yield prefix + key, node
+            if isinstance(node, Branch):
+                stack.append((prefix + key + "/", node, iter(node.keys())))
+
+    def iter_leaves(self,
+                    pattern: str = None,
+                    dtype=None,
+                    min_size: int = None,
+                    depth_first: bool = True,
+                    load: bool = False) -> Iterator[Tuple[str, "Leaf"]]:
+        """
+        Stream the leafs below the branch as (path, leaf) pairs, filtered on
+        a glob pattern of the path, the dtype and the minimum size in bytes
+        of the stored data. The data is only read with load
+        """
+        for path, node in self.walk(depth_first):
+            if not Branch._leaf_matches(path, node, pattern, dtype, min_size):
+                continue
+            if load:
+                node.data
+            yield path, node
+
+    async def aread(self,
+                    lazy: bool = False) -> "Branch":
+        """
+        Read the branch without blocking the event loop, the branches are
+        read by the io executor of the data-set
+        """
+        dataset = self.dataset
+        await dataset._call(functools.partial(self.read, lazy, dataset.io_executor))
+        return self
+
+    async def awalk(self,
+                    depth_first: bool = True) -> AsyncIterator[Tuple[str, Node]]:
+        """
+        Stream all the nodes below the branch as (path, node) pairs, like
+        walk. The children of a branch are loaded by the io executor of the
+        data-set and every node comes before its children
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.dataset.io_executor
+        pending = deque([("", self)])
+        while len(pending) > 0:
+            prefix, branch = pending.pop() if depth_first else pending.popleft()
+            await loop.run_in_executor(executor, branch._load_all)
+            children = []
+            for key, node in list(branch._content.items()):
+                yield prefix + key, node
+                if isinstance(node, Branch):
+                    children += [(prefix + key + "/", node)]
+            pending.extend(reversed(children) if depth_first else children)
+
+    async def aiter_leaves(self,
+                           pattern: str = None,
+                           dtype=None,
+                           min_size: int = None,
+                           depth_first: bool = True,
+                           load: bool = False) -> AsyncIterator[Tuple[str, "Leaf"]]:
+        """
+        Stream the leafs below the branch like iter_leaves, reading headers
+        and data by the io executor of the data-set
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.dataset.io_executor
+        async for path, node in self.awalk(depth_first):
+            if dtype is None:
+                matches = Branch._leaf_matches(path, node, pattern, dtype, min_size)
+            else:
+                matches = await loop.run_in_executor(executor, Branch._leaf_matches,
+                                                     path, node, pattern, dtype, min_size)
+            if not matches:
+                continue
+            if load:
+                await node.aread()
+            yield path, node
+
+    @staticmethod
+    def _leaf_matches(path: str,
+                      node: Node,
+                      pattern: str,
+                      dtype,
+                      min_size: int) -> bool:
+        if not isinstance(node, Leaf):
+            return False
+        if pattern is not None and not fnmatch.fnmatchcase(path, pattern):
+            return False
+        if min_size is not None and node.size < min_size:
+            return False
+        if dtype is not None and node.dtype != dtype:
+            return False
+        return True
+
     @staticmethod
     def create_branch(parent: "Branch",
                       name: str) -> "Branch":
@@ -162,6 +621,9 @@ class Branch(Node):
 
 class StructuredDataSet(Branch):
 
+    # default size of the io executor
+    io_workers = 8
+
     def __init__(self,
                  path: Path,
                  name: str,
@@ -172,17 +634,388 @@ class StructuredDataSet(Branch):
                          content,
                          meta)
         self._path = path
+        self._mmap_mode = None  # type: str
+        self._array_format = None  # type: str
+        self._pack_size = None  # type: int
+        self._catalog = None  # type: Catalog
+        self._cache = None  # type: LeafCache
+        self._change_log = None  # type: ChangeLog
+        self._stats = None  # type: IOStats
+        self._io_executor = None  # type: Executor
+        self._owns_io_executor = False
+        # runs the calls of the async functions that wait for the io executor
+        self._call_executor = None  # type: ThreadPoolExecutor
 
     @property
     def path(self):
         return self._path / self._name
 
+    @property
+    def array_format(self) -> str:
+        """
+        Extension of the leaf format used for numpy arrays assigned to the
+        data-set, for example "zlib". None stores them as plain .npy files
+        """
+        return self._array_format
+
+    @array_format.setter
+    def array_format(self, array_format: str) -> None:
+        self._array_format = array_format
+
+    @property
+    def pack_size(self) -> int:
+        """
+        Numpy arrays assigned to the data-set up to this size in bytes are
+        stored in the pack of their branch instead of a leaf folder of their
+        own. None stores every array in its own folder
+        """
+        return self._pack_size
+
+    @pack_size.setter
+    def pack_size(self, pack_size: int) -> None:
+        self._pack_size = pack_size
+
+    @property
+    def cache(self) -> LeafCache:
+        """
+        Cache limiting the data loaded by the leafs, None loads without limit
+        """
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: LeafCache) -> None:
+        self._cache = cache
+
+    @property
+    def io_executor(self) -> Executor:
+        """
+        Executor of the disk operations of the async functions, a pool of
+        io_workers threads by default. Its size bounds the concurrent disk
+        operations of all the async calls on the data-set. The default pool
+        is shut down by close, an executor that is set is left to its owner
+        """
+        if self._io_executor is None:
+            self._set_io_executor(ThreadPoolExecutor(max_workers=self.io_workers), owned=True)
+        return self._io_executor
+
+    @io_executor.setter
+    def io_executor(self, io_executor: Executor) -> None:
+        self._set_io_executor(io_executor, owned=False)
+
+    def close(self) -> None:
+        """
+        Shut down the thread pools of the async functions, they are created
+        again when needed
+        """
+        if self._call_executor is not None:
+            self._call_executor.shutdown()
+            self._call_executor = None
+        self._set_io_executor(None, owned=False)
+
+    async def awrite(self,
+                     transactional: bool = False) -> None:
+        """
+        Write the data-set without blocking the event loop, the files are
+        written by the io executor. The tree must not change until the write
+        is done
+        """
+        await self._call(functools.partial(self.write, executor=self.io_executor, transactional=transactional))
+
+    @staticmethod
+    async def aopen_dataset(path: Path,
+                            io_executor: Executor = None,
+                            **kwargs) -> "StructuredDataSet":
+        """
+        Open a data-set without blocking the event loop, the other arguments
+        are those of open_dataset. The data-set is opened by the io_executor,
+        which becomes the io executor of the data-set. By default that is a
+        new pool, shut down by close
+        """
+        owned = io_executor is None
+        if owned:
+            io_executor = ThreadPoolExecutor(max_workers=StructuredDataSet.io_workers)
+        try:
+            dataset = await asyncio.get_running_loop().run_in_executor(
+                io_executor, functools.partial(StructuredDataSet.open_dataset, path, **kwargs))
+        except BaseException:
+            if owned:
+                io_executor.shutdown(wait=False)
+            raise
+        dataset._set_io_executor(io_executor, owned)
+        return dataset
+
+    async def _call(self, function: Callable):
+        """
+        Run a call that waits for tasks of the io executor. It runs on a pool
+        of its own, on the io executor waiting calls could take up all the
+        threads the tasks are waiting for
+        """
+        if self._call_executor is None:
+            self._call_executor = ThreadPoolExecutor(max_workers=self.io_workers)
+            weakref.finalize(self, self._call_executor.shutdown, wait=False)
+        return await asyncio.get_running_loop().run_in_executor(self._call_executor, function)
+
+    def _set_io_executor(self,
+                         io_executor: Executor,
+                         owned: bool) -> None:
+        if self._owns_io_executor and self._io_executor is not io_executor:
+            self._io_executor.shutdown()
+        self._io_executor = io_executor
+        self._owns_io_executor = owned and io_executor is not None
+        if self._owns_io_executor:
+            # the pool of a data-set that is dropped without close
+            weakref.finalize(self, io_executor.shutdown, wait=False)
+
+    @property
+    def stats(self) -> IOStats:
+        """
+        Time and bytes spent per node in the disk operations of the
+        data-set, None when no stats are collected
+        """
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats: IOStats) -> None:
+        self._stats = stats
+
+    @property
+    def change_log(self) -> ChangeLog:
+        """
+        The log of the changes written to the data-set
+        """
+        if self._change_log is None:
+            self._change_log = ChangeLog(self.path / ChangeLog.file_name)
+        return self._change_log
+
+    @property
+    def catalog(self) -> Catalog:
+        """
+        The catalog of the nodes in the data-set, None when the data-set has no catalog
+        """
+        return self._catalog
+
+    def create_catalog(self) -> Catalog:
+        """
+        Create, or rebuild, the catalog of the data-set from the tree. The
+        catalog holds the nodes on disk, the data-set is written first
+        """
+        # the tree is listed from the directories while the catalog is rebuilt
+        if self._catalog is not None:
+            self._catalog.close()
+            self._catalog = None
+        self.write()
+        os.makedirs(self.path, exist_ok=True)
+        catalog = Catalog(self.path / Catalog.file_name)
+        catalog.rebuild(self)
+        self._catalog = catalog
+        return catalog
+
+    def find(self,
+             pattern: str = None,
+             kind: str = None,
+             leaf_format: str = None,
+             dtype: str = None) -> List[str]:
+        """
+        Paths, relative to the data-set, of the nodes matching the glob
+        pattern and the other properties. Requires a catalog
+        """
+        if self._catalog is None:
+            raise FileNotFoundError("The data-set {:s} has no catalog".format(str(self.path)))
+        return self._catalog.find(pattern, kind, leaf_format, dtype)
+
+    def consolidate(self) -> Path:
+        """
+        Gather the metas of all the nodes in a single file, a data-set with
+        consolidated metas is opened by reading that file only. The data-set
+        is written first
+        """
+        self.write()
+        return ConsolidatedMeta.write(self)
+
+    def remove(self) -> None:
+        if self._catalog is not None:
+            self._catalog.close()
+            self._catalog.path.unlink()
+            self._catalog = None
+        consolidated = self.path / ConsolidatedMeta.file_name
+        if consolidated.exists():
+            consolidated.unlink()
+        self._change_log = None
+        change_log = self.path / ChangeLog.file_name
+        if change_log.exists():
+            change_log.unlink()
+        super().remove()
+
+    @property
+    def mmap_mode(self) -> str:
+        """
+        Default memory-map mode of the leafs in the data-set, see numpy.load
+        """
+        return self._mmap_mode
+
+    @mmap_mode.setter
+    def mmap_mode(self, mmap_mode: str) -> None:
+        self._mmap_mode = mmap_mode
+
+    def write(self,
+              writer: Writer = None,
+              workers: int = None,
+              executor: Executor = None,
+              transactional: bool = False) -> None:
+        """
+        Write the changes of the data-set to disk. The files of the leafs and
+        metas are written by the executor, or by a pool of workers threads.
+        A transactional write stages all changes and commits them at the end,
+        see TransactionalWriter. After a failed transactional write the data
+        on disk is unchanged, the data-set has to be opened again. A
+        transactional write interrupted by a crash is finished or undone by
+        open_dataset
+        """
+        if executor is None and workers is not None:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                self.write(writer, executor=executor, transactional=transactional)
+            return
+        if writer is None:
+            if transactional:
+                writer = TransactionalWriter(executor, journal=self.path / TransactionalWriter.journal_name)
+            else:
+                writer = Writer(executor)
+            try:
+                super().write(writer)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.finish()
+            self._after_write(writer)
+        else:
+            super().write(writer)
+
+    def _after_write(self, writer: Writer) -> None:
+        """
+        Bring the change log, the catalog and the consolidated metas up to
+        date with a finished write, also of a single node of the data-set
+        """
+        if self._change_log is not None:
+            self._change_log.flush()
+        if self._catalog is not None:
+            self._catalog.update(self, writer.written, writer.removed)
+        if len(writer.written) + len(writer.removed) > 0:
+            # the consolidated metas are out of date
+            consolidated = self.path / ConsolidatedMeta.file_name
+            if consolidated.exists():
+                consolidated.unlink()
+
+    def build_branches(self,
+                       builders: Dict[str, Callable],
+                       workers: int = None,
+                       executor: Executor = None,
+                       n_ids: int = 2 ** 24) -> None:
+        """
+        Build new branches of the data-set in worker processes. Every builder
+        is called with an empty branch under its key and fills it, the branch
+        is written by the worker. Each branch gets a block of n_ids branch
+        ids, so the ids of the nodes are unique over the data-set. The
+        written branches are added to the data-set without writing their
+        data again. The builders have to be picklable, module level functions
+        """
+        for key in builders.keys():
+            if self._get_node(key) is not None:
+                raise KeyError("The data-set already holds the branch {:s}".format(key))
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self.build_branches(builders, executor=executor, n_ids=n_ids)
+            return
+
+        futures = {}
+        for key, builder in builders.items():
+            first = self._meta.reserve_ids(n_ids)
+            futures[key] = executor.submit(_build_branch, self._meta, first, n_ids, self.path,
+                                           self._array_format, self._pack_size, key, builder)
+        wait(futures.values())
+        for key, future in futures.items():
+            authors = future.result()
+            for author in authors:
+                self._meta.add_author(author)
+            branch = Branch(self,
+                            key,
+                            {},
+                            Meta.from_json(self.path / key / ".meta.json", self._meta))
+            branch.read(lazy=True)
+            self._content[key] = branch
+            self._dirty = True
+            self._add_size(branch.size)
+            if self._catalog is not None:
+                # the new branch is listed from its directories while it is added to the catalog
+                catalog = self._catalog
+                self._catalog = None
+                nodes = [branch] + [node for path, node in branch.walk()]
+                self._catalog = catalog
+                catalog.update(self, nodes, [])
+
+    @staticmethod
+    def open_dataset(path: Path,
+                     lazy: bool = False,
+                     mmap_mode: str = None,
+                     workers: int = None,
+                     use_catalog: bool = True,
+                     cache_size: int = None,
+                     use_consolidated: bool = True,
+                     stats: IOStats = None) -> "StructuredDataSet":
+        """
+        Open an existing data-set, path points to the .struct folder. With
+        lazy the tree is only read from disk as far as it is accessed. The
+        mmap_mode ("r", "r+" or "c") memory-maps the data of the leafs
+        instead of loading it into memory. With workers the branches of the
+        tree are read by a pool of threads. When the data-set has a catalog
+        the tree is listed from the catalog instead of the directories. The
+        cache_size limits the bytes of data kept loaded by the leafs. A
+        data-set with consolidated metas is opened from those. The stats
+        collect the time spent per node, including opening the data-set
+        """
+        recovered = (path / TransactionalWriter.journal_name).exists() and TransactionalWriter.recover(path)
+        if recovered:
+            # the interrupted write was finished, the consolidated metas and the catalog are out of date
+            if (path / ConsolidatedMeta.file_name).exists():
+                (path / ConsolidatedMeta.file_name).unlink()
+        consolidated = use_consolidated and (path / ConsolidatedMeta.file_name).exists()
+        if consolidated:
+            dataset = ConsolidatedMeta.read(path)
+        else:
+            meta = Meta.from_json(path / ".meta.json")
+            dataset = StructuredDataSet(path.parent,
+                                        path.stem,
+                                        {},
+                                        meta)
+        dataset.mmap_mode = mmap_mode
+        dataset.stats = stats
+        if cache_size is not None:
+            dataset.cache = LeafCache(cache_size)
+        if use_catalog and (path / Catalog.file_name).exists():
+            dataset._catalog = Catalog(path / Catalog.file_name)
+        if consolidated:
+            # the tree is read from the consolidated metas
+            pass
+        elif workers is None or lazy:
+            dataset.read(lazy=lazy)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                dataset.read(executor=executor)
+        if recovered and dataset._catalog is not None:
+            dataset.create_catalog()
+        return dataset
+
     @staticmethod
     def create_dataset(path: Path,
                        name: str,
                        author: Author,
-                       description: str = "") -> "StructuredDataSet":
+                       description: str = "",
+                       compact_meta: bool = False) -> "StructuredDataSet":
+        """
+        Create a new data-set, with compact_meta the metas are written as
+        compact json
+        """
         top_level_meta = Meta.create_top_level_meta(None, author, description=description)
+        top_level_meta.compact = compact_meta
         path_tmp = path / "{:s}.struct".format(name)
         path_meta = path_tmp / ".meta.json"
         top_level_meta.path = path_meta
@@ -193,8 +1026,40 @@ class StructuredDataSet(Branch):
                                  top_level_meta)
 
 
+def _build_branch(top_level_meta: Meta,
+                  first_id: int,
+                  n_ids: int,
+                  path: Path,
+                  array_format: str,
+                  pack_size: int,
+                  key: str,
+                  builder: Callable) -> list:
+    """
+    Build and write a branch of the data-set in a worker process, returns
+    the authors of the data-set as known by the worker
+    """
+    top_level_meta._use_ids(first_id, n_ids)
+    dataset = StructuredDataSet(path.parent,
+                                path.stem,
+                                {},
+                                top_level_meta)
+    dataset.array_format = array_format
+    dataset.pack_size = pack_size
+    branch = dataset[key]
+    builder(branch)
+    branch.write()
+    dataset.change_log.flush()
+    return top_level_meta.authors
+
+
 class Leaf(Node):
 
+    extension = None  # type: str
+    # leafs changing their file in place instead of writing it as a whole,
+    # only the first in_place_header_size bytes of the file are rewritten
+    writes_in_place = False
+    in_place_header_size = 0
+
     def __init__(self, 
                  parent: Node,
                  name: str,
@@ -204,19 +1069,93 @@ class Leaf(Node):
                          name)
       
     # public functions
-    def write(self) -> None:
-        if not self.path.exists():
-            self.path.mkdir()
-        self.meta.write()
-        self._write_child()
+    def write(self, writer: Writer = None) -> None:
+        if not self.is_dirty:
+            return
+        if writer is None:
+            writer = Writer()
+            self.write(writer)
+            writer.defer(self._write_ancestor_metas, writer)
+            writer.finish()
+            self.dataset._after_write(writer)
+            return
+
+        self._makedirs(writer)
+        if self._dirty:
+            if self.writes_in_place:
+                path = writer.in_place(self.file_path, self.in_place_header_size)
+            else:
+                path = writer.target(self.file_path)
+            writer.submit(self._write_child, path)
+            writer.defer(self._update_size, path)
+        writer.defer(self._finish_write, writer)
+
+    def _update_size(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            # nothing was written, the data is unchanged
+            size = self.file_size
+        self._parent._add_size(size - self.size)
+        self.meta.update_file_properties(size=size, n_childs=0)
+
+    def _finish_write(self, writer: Writer) -> None:
+        # the leaf stays dirty, and loaded in the cache, until its data is written
+        self._dirty = False
+        if self.meta.is_dirty:
+            self._write_meta(writer)
+        writer.node_written(self)
+
+    @logger.instrument("meta", lambda node, result, writer: result)
+    def _write_meta(self, writer: Writer) -> int:
+        return self.meta.write(writer)
+
+    @property
+    def file_path(self) -> Path:
+        return self.path / "data.{:s}".format(self.extension)
+
+    @property
+    def file_size(self) -> int:
+        """
+        Size in bytes of the data of the leaf on disk
+        """
+        return self.file_path.stat().st_size
+
+    @property
+    def dtype(self):
+        return None
+
+    @property
+    def shape(self):
+        return None
 
     @property
     def data(self):
         return self._get_data()
 
+    async def aread(self):
+        """
+        The data of the leaf, read by the io executor of the data-set
+        without blocking the event loop
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.dataset.io_executor, self._get_data)
+
     @data.setter
     def data(self, data):
         self._set_data(data)
+        self._dirty = True
+
+    def _unload(self) -> None:
+        """
+        Release the loaded data, it is read again on the next access
+        """
+        pass
+
+    def _opened(self) -> None:
+        """
+        Called when the leaf is created for data that is already on disk
+        """
+        self._dirty = False
 
     @abc.abstractmethod
     def _get_data(self):
@@ -226,20 +1165,33 @@ class Leaf(Node):
     def _set_data(self, data):
         raise NotImplementedError("Must override the _set_data function")
 
+    @abc.abstractmethod
+    def _write_child(self, path: Path) -> None:
+        """
+        Write the data to the file at path, the final location of the file
+        is file_path
+        """
+        raise NotImplementedError("Must override the _write_child function")
+
     @staticmethod
     def initialize(parent: Node,
                    name: str) -> "Leaf":
         name = name.replace(".leaf", "")
-        leaf_path = (parent.path / name).with_suffix(".leaf")
-        meta = Meta.from_json(leaf_path / ".meta.json")
+        leaf_path = parent.path / "{:s}.leaf".format(name)
+        meta = Meta.from_json(leaf_path / ".meta.json", parent.top_level_meta)
 
         # read all the non-hidden files
-        content = list(leaf_path.with_suffix(".leaf").glob("./*"))
-        content = list(filter(lambda x: not x.stem.startswith("."), content))
+        with os.scandir(leaf_path) as entries:
+            content = [entry.name for entry in entries if not entry.name.startswith(".")]
 
-        if len(content) == 0:
+        if len(content) == 1:
             import data_formats
-            return data_formats.available_extensions[content[0].suffix](parent, name.replace(".leaf"), meta)
+            extension = os.path.splitext(content[0])[1][1:]
+            leaf = data_formats.available_extensions[extension](parent,
+                                                                "{:s}.leaf".format(name),
+                                                                meta)
+            leaf._opened()
+            return leaf
         else:
             if len(content) > 1:
                 raise FileNotFoundError("To many files in the leaf")
@@ -0,0 +1,59 @@
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+from writer import Writer
+
+
+class TestLeafCache(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_cache")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_budget(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "budget",
+                                                   self._author)
+        for i_leaf in range(10):
+            dataset["leafs"]["leaf_{:d}".format(i_leaf)] = numpy.full(1000, i_leaf, dtype=numpy.float64)
+        dataset.write()
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, lazy=True, cache_size=25000)
+        cache = dataset_read.cache
+        for i_leaf in range(10):
+            self.assertEqual(dataset_read["leafs"]["leaf_{:d}".format(i_leaf)].data[0], i_leaf)
+        self.assertLessEqual(cache.size, 25000)
+        self.assertEqual(cache.misses, 10)
+        self.assertEqual(cache.evictions, 7)
+
+        # the most recently used leaf is still loaded, the first one is read again
+        self.assertEqual(dataset_read["leafs"]["leaf_9"].data[0], 9)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(dataset_read["leafs"]["leaf_0"].data[0], 0)
+        self.assertEqual(cache.misses, 11)
+
+        # changed data is never unloaded
+        dataset_read["leafs"]["leaf_1"] = numpy.ones(2000)
+        for i_leaf in range(2, 10):
+            dataset_read["leafs"]["leaf_{:d}".format(i_leaf)].data
+        self.assertTrue(numpy.all(dataset_read["leafs"]["leaf_1"].data == 1))
+
+        # it stays loaded until its write is done
+        writer = Writer()
+        dataset_read.write(writer)
+        cache.clear()
+        self.assertTrue(dataset_read["leafs"]["leaf_1"].is_dirty)
+        writer.finish()
+
+        # after writing it can be unloaded
+        dataset_read.write()
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertTrue(numpy.all(dataset_read["leafs"]["leaf_1"].data == 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
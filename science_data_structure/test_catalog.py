@@ -0,0 +1,68 @@
+import unittest
+import numpy
+from pathlib import Path
+from structures import StructuredDataSet
+from author import Author
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self._test_path = Path("../test_catalog")
+        self._test_path.mkdir(exist_ok=True)
+        self._author = Author.create_author("Test Author")
+
+    def test_catalog(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "catalog",
+                                                   self._author)
+        dataset["a"]["x"] = numpy.zeros((10, 3))
+        dataset["a"]["b"]["y"] = numpy.arange(5)
+        dataset["c"]["z"] = numpy.arange(5.0)
+        # the unwritten nodes are written first
+        catalog = dataset.create_catalog()
+        self.assertFalse(dataset.is_dirty)
+
+        self.assertEqual(sorted(catalog.children("a")), [("b", "branch"), ("x.leaf", "leaf")])
+        record = catalog.record("a/x.leaf")
+        self.assertEqual(record["shape"], (10, 3))
+        self.assertEqual(record["dtype"], "float64")
+        self.assertEqual(record["leaf_format"], "npy")
+        self.assertEqual(record["size"], (dataset["a"]["x"].path / "data.npy").stat().st_size)
+
+        # the catalog is kept in sync by write
+        dataset["c"] = None
+        dataset["a"]["b"]["w"] = numpy.arange(3.0)
+        dataset.write()
+        self.assertEqual(dataset.find(pattern="c*"), [])
+        self.assertEqual(dataset.find(kind="leaf", dtype="float64"), ["a/b/w.leaf", "a/x.leaf"])
+
+        # and by flushing a single leaf, which makes the consolidated metas out of date
+        rows = dataset["a"].add_leaf("rows", leaf_format="npa")
+        rows.append(numpy.zeros((3, 2)))
+        dataset.write()
+        dataset.consolidate()
+        rows.append(numpy.ones((2, 2)))
+        rows.flush()
+        self.assertEqual(catalog.record("a/rows.leaf")["shape"], (5, 2))
+        self.assertEqual(catalog.record("a/rows.leaf")["size"], rows.file_path.stat().st_size)
+        self.assertFalse((dataset.path / ".consolidated.json").exists())
+        dataset["a"]["rows"] = None
+        dataset.write()
+
+        # rebuild the catalog of a lazily opened data-set
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, lazy=True, use_catalog=False)
+        self.assertEqual(len(dataset_read.create_catalog().find()), 5)
+
+        # open the data-set from the catalog
+        dataset_read = StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        self.assertIsNotNone(dataset_read.catalog)
+        self.assertEqual(sorted(dataset_read["a"]["b"].keys()), ["w", "y"])
+        self.assertTrue(numpy.all(dataset_read["a"]["b"]["w"].data == numpy.arange(3.0)))
+
+        dataset_read.remove()
+        self.assertFalse(dataset.path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
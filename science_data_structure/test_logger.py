@@ -1,7 +1,11 @@
 import unittest
+import json
+import numpy
 import structures
 from pathlib import Path
+from author import Author
 from config import ConfigManager
+from meta import Meta
 
 
 class TestLogger(unittest.TestCase):
@@ -19,5 +23,24 @@ class TestLogger(unittest.TestCase):
 
         dataset.write()
 
+    def test_change_log(self):
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path, "test_change_log",
+                                                              Author.create_author("Test Author"))
+        n_logged = len(list(dataset.change_log.entries(node="x")))
+        n_writes = Meta.log_size + 4
+        for i_write in range(n_writes):
+            dataset["x"]["y"] = numpy.full(3, i_write)
+            dataset.write()
+
+        # every write appends to the log, the metas only refer to the last entries
+        entries = list(dataset.change_log.entries(node="x"))[n_logged:]
+        self.assertEqual(len(entries), n_writes)
+        self.assertTrue(all(entry["action"] == "write" for entry in entries))
+        content = json.loads(dataset["x"].meta.path.read_text())
+        self.assertEqual(content["log"], [entry["id"] for entry in entries[-Meta.log_size:]])
+
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(dataset_read["x"].meta.log, [int(entry["id"]) for entry in entries[-Meta.log_size:]])
+
 if __name__ == "__main__":
     unittest.main()
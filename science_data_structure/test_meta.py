@@ -1,4 +1,5 @@
 import unittest
+import json
 import numpy
 from meta import Meta
 from author import Author
@@ -42,5 +43,45 @@ class TestMeta(unittest.TestCase):
         dataset.write()
         x.meta.write()
 
+    def test_author_table(self):
+        author = Author.create_author("Test Author")
+        other = Author.create_author("Other Author")
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "test_meta_authors",
+                                                   author)
+        dataset["x"]["y"] = numpy.zeros(3)
+        dataset["x"].meta.add_author(other)
+        dataset.write()
+
+        # the node metas only refer to the authors of the data-set
+        content = json.loads(dataset["x"].meta.path.read_text())
+        self.assertEqual(content["author_ids"], [str(other.author_id)])
+        self.assertNotIn("authors", content)
+
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual([a.author_id for a in dataset_read.meta.authors], [author.author_id, other.author_id])
+        self.assertEqual([a.name for a in dataset_read["x"].meta.authors], ["Other Author"])
+        self.assertEqual(dataset_read["x"].meta.authors[0].created_on.date(), other.created_on.date())
+
+    def test_compact(self):
+        dataset = StructuredDataSet.create_dataset(self._test_path,
+                                                   "test_meta_compact",
+                                                   Author.create_author("Test Author"),
+                                                   compact_meta=True)
+        dataset["x"]["y"] = numpy.zeros(3)
+        dataset.write()
+
+        text = dataset["x"]["y"].meta.path.read_text()
+        self.assertNotIn("\n", text)
+        self.assertNotIn("description", text)
+
+        # the metas stay compact after opening the data-set again
+        dataset_read = StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(dataset_read["x"].meta.compact)
+        dataset_read["x"]["z"] = numpy.zeros(3)
+        dataset_read.write()
+        self.assertNotIn("\n", dataset_read["x"]["z"].meta.path.read_text())
+        self.assertEqual(sorted(StructuredDataSet.open_dataset(dataset.path)["x"].keys()), ["y", "z"])
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,17 @@
+import asyncio
+import os
 import unittest
+import unittest.mock
 import structures
 import pathlib
+import shutil
 import numpy
 from meta import Meta
 from author import Author
 from config import ConfigManager
+from stats import IOStats
+from writer import TransactionalWriter
+from data_formats.packed_formats import Pack, LeafPacked
 
 
 class TestStructuredDataset(unittest.TestCase):
@@ -124,6 +131,455 @@ class TestStructuredDataset(unittest.TestCase):
         for key in dataset_read.keys():
             self.assertTrue(key in dataset_read.keys())
 
+    def test_incremental_write(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "incremental",
+                                                              self._author)
+        dataset["a"]["x"] = numpy.zeros(100)
+        dataset["b"]["y"] = numpy.zeros(100)
+        dataset.write()
+
+        # remove files behind the back of the data-set, clean nodes must not be rewritten
+        data_x = dataset["a"]["x"].path / "data.npy"
+        meta_a = dataset["a"].meta.path
+        data_x.unlink()
+        meta_a.unlink()
+
+        dataset["b"]["y"] = numpy.ones(100)
+        dataset.write()
+
+        self.assertFalse(data_x.exists())
+        self.assertFalse(meta_a.exists())
+        self.assertTrue(numpy.all(numpy.load(dataset["b"]["y"].path / "data.npy") == 1))
+
+        # replacing a leaf must not remove the newly written data
+        dataset["b"]["y"] = numpy.ones(10)
+        dataset.write()
+        self.assertEqual(numpy.load(dataset["b"]["y"].path / "data.npy").shape, (10, ))
+
+        # in place changes are only written after marking the node dirty
+        dataset["a"]["x"].set_dirty()
+        dataset.write()
+        self.assertTrue(data_x.exists())
+
+    def test_lazy_read(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "lazy",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(10)
+        dataset["b"]["y"] = numpy.arange(20)
+        dataset.write()
+
+        # break the meta of branch b, a lazy open only parses what is accessed
+        meta_b = dataset["b"].meta.path
+        meta_b.write_text("")
+
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        self.assertEqual(sorted(dataset_read.keys()), ["a", "b"])
+        self.assertTrue(numpy.all(dataset_read["a"]["x"].data == numpy.arange(10)))
+
+        with self.assertRaises(ValueError):
+            structures.StructuredDataSet.open_dataset(dataset.path)
+
+        dataset["b"].meta.write()
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(dataset_read["b"].keys(), ["y"])
+        self.assertTrue(numpy.all(dataset_read["b"]["y"].data == numpy.arange(20)))
+
+        # a read data-set is clean and replacing a lazy child removes it on the next write
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        self.assertFalse(dataset_read.is_dirty)
+        dataset_read["b"] = None
+        dataset_read.write()
+        self.assertFalse((dataset.path / "b").exists())
+
+    def test_parallel_write(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "parallel",
+                                                              self._author)
+        for i_branch in range(4):
+            for i_leaf in range(8):
+                dataset["branch_{:d}".format(i_branch)]["leaf_{:d}".format(i_leaf)] = numpy.full(1000, i_leaf)
+        dataset.write(workers=4)
+
+        for i_branch in range(4):
+            branch = dataset["branch_{:d}".format(i_branch)]
+            for i_leaf in range(8):
+                data = numpy.load(branch["leaf_{:d}".format(i_leaf)].path / "data.npy")
+                self.assertTrue(numpy.all(data == i_leaf))
+
+        # replaced and removed nodes
+        dataset["branch_0"]["leaf_0"] = numpy.zeros(3)
+        dataset["branch_1"] = None
+        dataset.write(workers=4)
+        self.assertEqual(numpy.load(dataset["branch_0"]["leaf_0"].path / "data.npy").shape, (3, ))
+        self.assertFalse((dataset.path / "branch_1").exists())
+
+    def test_parallel_read(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "parallel_read",
+                                                              Author.create_author("Test Author"))
+        for i_branch in range(3):
+            branch = dataset["branch_{:d}".format(i_branch)]
+            self.add_branches_recursive(branch, 3)
+            self.add_data_in_all_branches(branch, numpy.arange(10))
+        dataset.write()
+
+        dataset_sequential = structures.StructuredDataSet.open_dataset(dataset.path)
+        dataset_parallel = structures.StructuredDataSet.open_dataset(dataset.path, workers=4)
+        self.assertEqual(self.list_tree(dataset_sequential), self.list_tree(dataset))
+        self.assertEqual(self.list_tree(dataset_parallel), self.list_tree(dataset))
+
+    def test_sizes(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "sizes",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.zeros(100)
+        dataset["a"]["b"]["y"] = numpy.zeros(200)
+        dataset["c"]["z"] = numpy.zeros(300)
+        dataset.write(workers=2)
+
+        size_x = dataset["a"]["x"].file_size
+        size_y = dataset["a"]["b"]["y"].file_size
+        size_z = dataset["c"]["z"].file_size
+        self.assertEqual(dataset["a"].size, size_x + size_y)
+        self.assertEqual(dataset.size, size_x + size_y + size_z)
+        self.assertEqual(dataset["a"].meta.file_properties.n_childs, 2)
+
+        # replace and remove nodes
+        dataset["a"]["x"] = numpy.zeros(1000)
+        dataset["c"] = None
+        dataset.write()
+        size_x = dataset["a"]["x"].file_size
+        self.assertEqual(dataset.size, size_x + size_y)
+
+        # the properties are stored in the metas
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        self.assertEqual(dataset_read.size, size_x + size_y)
+        self.assertEqual(dataset_read.meta.file_properties.n_childs, 1)
+
+    def test_transactional_write(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "transactional",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(10)
+        dataset["b"]["y"] = numpy.arange(20)
+        dataset.write(transactional=True, workers=2)
+        self.assertTrue(numpy.all(numpy.load(dataset["a"]["x"].file_path) == numpy.arange(10)))
+        self.assertEqual(list(dataset.path.glob("**/.*.tmp")), [])
+
+        dataset["a"]["x"] = numpy.ones(10)
+        dataset["b"] = None
+        dataset.write(transactional=True)
+        self.assertTrue(numpy.all(numpy.load(dataset["a"]["x"].file_path) == 1))
+        self.assertFalse((dataset.path / "b").exists())
+        self.assertEqual(list(dataset.path.glob("**/.*.removed")), [])
+
+        # a failing write leaves the data on disk as it was
+        dataset["b"]["y"] = numpy.arange(20)
+        dataset.write(transactional=True)
+        dataset["a"]["x"] = numpy.zeros(10)
+        dataset["b"] = None
+        dataset["c"].add_leaf("z", numpy.array([object()]), leaf_format="zlib")
+        with self.assertRaises(TypeError):
+            dataset.write(transactional=True)
+        self.assertEqual(list(dataset.path.glob("**/.*.tmp")), [])
+        self.assertEqual(list(dataset.path.glob("**/.*.removed")), [])
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertTrue(numpy.all(dataset_read["a"]["x"].data == 1))
+        self.assertTrue(numpy.all(dataset_read["b"]["y"].data == numpy.arange(20)))
+
+        # files changed in place are restored as well
+        rows = dataset_read["a"].add_leaf("rows", leaf_format="npa")
+        rows.append(numpy.zeros((3, 2)))
+        dataset_read.write(transactional=True)
+        size = rows.file_path.stat().st_size
+        rows.append(numpy.ones((2, 2)))
+        dataset_read["c"].add_leaf("z", numpy.array([object()]), leaf_format="zlib")
+        with self.assertRaises(TypeError):
+            dataset_read.write(transactional=True)
+        self.assertEqual(rows.file_path.stat().st_size, size)
+        self.assertEqual(numpy.load(rows.file_path).shape, (3, 2))
+        self.assertFalse((dataset.path / TransactionalWriter.journal_name).exists())
+
+    def test_recover(self) -> None:
+        shutil.rmtree(self._test_path / "recover.struct", ignore_errors=True)
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "recover",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(10)
+        dataset["b"]["y"] = numpy.arange(20)
+        rows = dataset["a"].add_leaf("rows", leaf_format="npa")
+        rows.append(numpy.zeros((3, 2)))
+        dataset.write()
+        journal = dataset.path / TransactionalWriter.journal_name
+
+        # a write that is still running is left alone
+        writer = TransactionalWriter(journal=journal)
+        dataset["a"]["x"] = numpy.full(10, 3)
+        dataset.write(writer)
+        structures.StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        self.assertTrue(journal.exists())
+        self.assertNotEqual(list(dataset.path.glob("**/.*.tmp")), [])
+        writer.finish()
+        self.assertFalse(journal.exists())
+        self.assertTrue(numpy.all(numpy.load(dataset["a"]["x"].file_path) == 3))
+
+        # a write that crashed before committing is undone, the crash released the lock on the journal
+        writer = TransactionalWriter(journal=journal)
+        dataset["a"]["x"] = numpy.ones(10)
+        dataset["b"] = None
+        dataset["d"]["z"] = numpy.arange(3)
+        rows.append(numpy.ones((2, 2)))
+        dataset.write(writer)
+        writer._release_journal()
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertFalse(journal.exists())
+        self.assertEqual(sorted(dataset_read.keys()), ["a", "b"])
+        self.assertTrue(numpy.all(dataset_read["a"]["x"].data == 3))
+        self.assertEqual(dataset_read["a"]["rows"].shape, (3, 2))
+        self.assertEqual(list(dataset.path.glob("**/.*.tmp")) + list(dataset.path.glob("**/.*.removed")), [])
+
+        # a write that crashed while committing is finished
+        dataset_read["a"]["x"] = numpy.full(10, 2)
+        dataset_read["b"] = None
+        replace = os.replace
+        replaced = []
+
+        def crash(path, destination):
+            # after renaming the first staged file
+            if path.name.endswith(".tmp"):
+                if len(replaced) == 1:
+                    raise OSError("crash")
+                replaced.append(path)
+            replace(path, destination)
+
+        with unittest.mock.patch("os.replace", crash):
+            with self.assertRaises(OSError):
+                dataset_read.write(transactional=True)
+        self.assertTrue(journal.exists())
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(sorted(dataset_read.keys()), ["a"])
+        self.assertTrue(numpy.all(dataset_read["a"]["x"].data == 2))
+        self.assertEqual(list(dataset.path.glob("**/.*.tmp")) + list(dataset.path.glob("**/.*.removed")), [])
+
+    def test_consolidate(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "consolidated",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(10)
+        dataset["a"]["b"].add_leaf("y", numpy.arange(5), leaf_format="zlib")
+        dataset["c"]["z"] = numpy.arange(3)
+        dataset.meta.description = "consolidated"
+        path = dataset.consolidate()
+        self.assertTrue(path.exists())
+
+        # the tree and the metas come from the consolidated file only
+        for meta_path in dataset.path.glob("**/.meta.json"):
+            meta_path.rename(meta_path.with_name(".meta.json.moved"))
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertEqual(self.list_tree(dataset_read), self.list_tree(dataset))
+        self.assertEqual(dataset_read.meta.description, "consolidated")
+        self.assertEqual(dataset_read["a"].meta.branch_id, dataset["a"].meta.branch_id)
+        self.assertEqual(dataset_read.size, dataset.size)
+        self.assertTrue(numpy.all(dataset_read["a"]["b"]["y"].data == numpy.arange(5)))
+        self.assertFalse(dataset_read.is_dirty)
+        for meta_path in dataset.path.glob("**/.meta.json.moved"):
+            meta_path.rename(meta_path.with_name(".meta.json"))
+
+        # writing changes makes the consolidated metas out of date
+        dataset_read["c"] = None
+        dataset_read.write()
+        self.assertFalse(path.exists())
+        self.assertEqual(sorted(structures.StructuredDataSet.open_dataset(dataset.path).keys()), ["a"])
+
+        # so does writing a single leaf
+        dataset_read["a"].add_leaf("rows", numpy.arange(4), leaf_format="npa")
+        dataset_read.consolidate()
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        dataset_read["a"]["rows"].append(numpy.arange(2))
+        dataset_read["a"]["rows"].flush()
+        self.assertFalse(path.exists())
+        self.assertEqual(structures.StructuredDataSet.open_dataset(dataset.path)["a"]["rows"].shape, (6, ))
+
+    def test_build_branches(self) -> None:
+        shutil.rmtree(self._test_path / "build.struct", ignore_errors=True)
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "build",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(3)
+        dataset.write()
+        dataset.create_catalog()
+
+        dataset.build_branches({"branch_{:d}".format(i_branch): build_branch for i_branch in range(3)},
+                               workers=2)
+        dataset.write()
+        self.assertEqual(sorted(dataset.keys()), ["a", "branch_0", "branch_1", "branch_2"])
+        self.assertTrue(numpy.all(dataset["branch_1"]["b"]["y"].data == numpy.arange(5)))
+        self.assertEqual(dataset.catalog.find(pattern="branch_2/*", kind="leaf"), ["branch_2/b/y.leaf", "branch_2/x.leaf"])
+
+        # the ids are unique over the data-set, also after opening it again
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, use_catalog=False)
+        self.assertEqual(dataset_read.size, dataset.size)
+        dataset_read["c"]["z"] = numpy.arange(2)
+        branch_ids = [dataset_read.meta.branch_id]
+        branches = [dataset_read]
+        while len(branches) > 0:
+            branch = branches.pop()
+            branches += branch.branches
+            branch_ids += [node.meta.branch_id for node in branch.branches + branch.leafs]
+        self.assertEqual(len(branch_ids), 17)
+        self.assertEqual(len(set(branch_ids)), len(branch_ids))
+
+    def test_build_packed_branches(self) -> None:
+        shutil.rmtree(self._test_path / "build_packed.struct", ignore_errors=True)
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "build_packed",
+                                                              Author.create_author("Test Author"))
+        dataset.pack_size = 1024
+        dataset.build_branches({"branch_{:d}".format(i_branch): build_branch for i_branch in range(2)},
+                               workers=2)
+        dataset.write()
+        # the workers pack the small leafs like the data-set does
+        self.assertTrue((dataset.path / "branch_1" / Pack.file_name).exists())
+        self.assertTrue((dataset.path / "branch_1" / "b" / Pack.file_name).exists())
+
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path)
+        self.assertIsInstance(dataset_read["branch_1"]["x"], LeafPacked)
+        self.assertTrue(numpy.all(dataset_read["branch_1"]["b"]["y"].data == numpy.arange(5)))
+
+    def test_stats(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "stats",
+                                                              Author.create_author("Test Author"))
+        dataset.stats = IOStats()
+        dataset["a"]["x"] = numpy.zeros(1000)
+        dataset["b"].add_leaf("y", numpy.zeros(1000), leaf_format="zlib")
+        dataset.write()
+
+        operations = dataset.stats.operations
+        self.assertEqual(operations["write"]["count"], 2)
+        self.assertEqual(operations["write"]["bytes"], dataset.size)
+        self.assertEqual(operations["meta"]["count"], 5)
+        self.assertEqual(dataset.stats.nodes["a/x.leaf"]["write"]["bytes"], dataset["a"]["x"].file_size)
+        self.assertIn("a/x.leaf", [node for node, seconds in dataset.stats.slowest(5)])
+
+        dataset["b"] = None
+        dataset.write()
+        self.assertEqual(dataset.stats.operations["remove"]["count"], 1)
+
+        stats = IOStats()
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, stats=stats)
+        dataset_read["a"]["x"].data
+        self.assertEqual(stats.operations["open"]["count"], 2)
+        self.assertEqual(stats.operations["read"]["bytes"], dataset["a"]["x"].file_size)
+        self.assertIn("read", str(stats))
+
+        # without stats nothing is recorded
+        dataset.stats = None
+        dataset["a"]["x"] = numpy.ones(10)
+        dataset.write()
+        self.assertEqual(stats.operations.keys(), {"open", "read"})
+
+    def test_walk(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "walk",
+                                                              Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.zeros(10)
+        dataset["a"]["b"]["y"] = numpy.zeros(1000, dtype=numpy.int32)
+        dataset["c"]["z"] = numpy.zeros(1000)
+        dataset.write()
+
+        dataset_read = structures.StructuredDataSet.open_dataset(dataset.path, lazy=True)
+        paths = [path for path, node in dataset_read.walk()]
+        self.assertEqual(sorted(paths), ["a", "a/b", "a/b/y", "a/x", "c", "c/z"])
+        # every node comes before its children
+        self.assertLess(paths.index("a"), paths.index("a/b"))
+        self.assertLess(paths.index("a/b"), paths.index("a/b/y"))
+        levels = [path.count("/") for path, node in dataset_read.walk(depth_first=False)]
+        self.assertEqual(levels, sorted(levels))
+
+        self.assertEqual(sorted(path for path, leaf in dataset_read.iter_leaves()), ["a/b/y", "a/x", "c/z"])
+        self.assertEqual(sorted(path for path, leaf in dataset_read.iter_leaves(pattern="a/*")), ["a/b/y", "a/x"])
+        self.assertEqual([path for path, leaf in dataset_read.iter_leaves(dtype="int32")], ["a/b/y"])
+        self.assertEqual(sorted(path for path, leaf in dataset_read.iter_leaves(min_size=1000)), ["a/b/y", "c/z"])
+        # the data is only read when asked
+        self.assertFalse(dataset_read["c"]["z"]._is_read)
+        for path, leaf in dataset_read["c"].iter_leaves(load=True):
+            self.assertTrue(leaf._is_read)
+
+    def test_path_access(self) -> None:
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "paths",
+                                                              Author.create_author("Test Author"))
+        dataset["a/b/x"] = numpy.arange(3)
+        self.assertIs(dataset["a/b/x"], dataset["a"]["b"]["x"])
+        self.assertIs(dataset["a/b/x"].path, dataset["a/b/x"].path)
+
+        dataset.update({"a/b/y": numpy.arange(4),
+                        "a/c/z": numpy.arange(5),
+                        "d": numpy.arange(6)})
+        dataset.write()
+        self.assertEqual(self.list_tree(structures.StructuredDataSet.open_dataset(dataset.path)),
+                         ["a", "a/b", "a/b/x", "a/b/y", "a/c", "a/c/z", "d"])
+
+        with self.assertRaises(KeyError):
+            dataset["d/e"] = numpy.arange(1)
+        for path in ("", "/a", "a/", "a//b", "/"):
+            with self.assertRaises(KeyError):
+                dataset[path]
+            with self.assertRaises(KeyError):
+                dataset[path] = numpy.arange(1)
+            with self.assertRaises(KeyError):
+                dataset.update({path: numpy.arange(1)})
+        self.assertEqual(sorted(dataset.keys()), ["a", "d"])
+        dataset["a/c"] = None
+        self.assertEqual(dataset["a"].keys(), ["b"])
+
+    def test_async(self) -> None:
+        shutil.rmtree(self._test_path / "async.struct", ignore_errors=True)
+        dataset = structures.StructuredDataSet.create_dataset(self._test_path,
+                                                              "async",
+                                                              Author.create_author("Test Author"))
+        dataset.io_workers = 2
+        for i_leaf in range(8):
+            dataset["a/b/leaf_{:d}".format(i_leaf)] = numpy.arange(i_leaf + 1)
+        dataset["c"] = numpy.zeros(10)
+
+        async def run():
+            await dataset.awrite()
+            dataset_read = await structures.StructuredDataSet.aopen_dataset(dataset.path, lazy=True)
+            # concurrent walks load every branch once
+            walks = await asyncio.gather(*[collect(dataset_read.awalk()) for _ in range(4)])
+            leafs = {path: await leaf.aread() async for path, leaf in dataset_read.aiter_leaves(pattern="a/*")}
+            await dataset_read["a"].aread()
+            return dataset_read, walks, leafs
+
+        async def collect(walk):
+            return [(path, node) async for path, node in walk]
+
+        dataset_read, walks, leafs = asyncio.run(run())
+        self.assertEqual(sorted(path for path, node in walks[0]), self.list_tree(dataset))
+        for walk in walks[1:]:
+            self.assertEqual(sorted(walk), sorted(walks[0]))
+        self.assertEqual(len(leafs), 8)
+        self.assertTrue(numpy.all(leafs["a/b/leaf_3"] == numpy.arange(4)))
+
+        # the data-set shuts down its pools, the pool it was opened with included
+        io_executor = dataset_read.io_executor
+        dataset_read.close()
+        with self.assertRaises(RuntimeError):
+            io_executor.submit(print)
+        dataset.close()
+
+    def list_tree(self, branch: structures.Branch, prefix: str = "") -> list:
+        names = []
+        for key in sorted(branch.keys()):
+            names += [prefix + key]
+            if isinstance(branch[key], structures.Branch):
+                names += self.list_tree(branch[key], prefix + key + "/")
+        return names
+
     def add_leafs_recursive(self, parent_leaf: structures.Leaf, depth) -> None:
         if depth > 0:
             for i_leaf in range(depth):
@@ -166,6 +622,11 @@ class TestStructuredDataset(unittest.TestCase):
         self._test_path.rmdir()
 
 
+def build_branch(branch: structures.Branch) -> None:
+    branch["x"] = numpy.arange(10)
+    branch["b"]["y"] = numpy.arange(5)
+
+
 if __name__ == "__main__":
     unittest.main()
 
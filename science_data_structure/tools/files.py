@@ -1,5 +1,7 @@
 from pathlib import Path
 import click
+import json
+import os
 
 APP_NAME = "science_data_structure"
 
@@ -16,9 +18,10 @@ def find_top_level_meta(path: Path):
     path = path.absolute()
 
     if (path / ".meta.json").exists():
-        meta = Meta.from_json(path / ".meta.json")
-        if meta.branch_id == 0:
-            return meta
+        # the metas of the nodes refer to the authors in the top level meta
+        content = json.loads((path / ".meta.json").read_text())
+        if int(content["branch_id"]) == 0 and "author_ids" not in content:
+            return Meta.from_json(path / ".meta.json")
         return find_top_level_meta(path.parent)
     if str(path.parent) == "/":
         raise FileNotFoundError("This folder is not part of a dataset")
@@ -37,31 +40,81 @@ def get_folder_size(path: Path):
     return folder_size
 
 
-def set_file_properties(path: Path, dig: bool = True) -> int:
+def set_file_properties(path: Path, dig: bool = True, top_level_meta=None) -> int:
     """
-    Compute the size of the current branch, including all the subbranches
-    The meta files of the subbranches is also updated
+    Compute the size of the data in the leafs of the current branch, including
+    all the subbranches, and store it with the number of children in the meta.
+    With dig the metas of the subbranches are updated as well. A data-set
+    keeps these properties up to date while writing, this rebuilds them after
+    the tree was changed by hand
     """
-    from science_data_structure.meta import Meta, FileProperty
-    meta = Meta.from_json(path / ".meta.json")
-    
-    folder_size = path.stat().st_size
-    for child in path.iterdir():
-        if child.is_dir():
-            if dig:
-                folder_size += set_file_properties(child)
+    from science_data_structure.meta import Meta
+
+    if top_level_meta is None:
+        top_level_meta = find_top_level_meta(path)
+    size = 0
+    n_childs = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == ".pack":
+                index = packed_index(Path(entry.path))
+                n_childs += len(index)
+                size += sum(packed["length"] for packed in index.values())
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                n_childs += 1
+                if dig:
+                    size += set_file_properties(Path(entry.path), top_level_meta=top_level_meta)
+                else:
+                    size += get_data_size(Path(entry.path))
             else:
-                folder_size += get_folder_size(child)
-        else:
-            folder_size += child.stat().st_size
+                # the data file of a leaf
+                size += entry.stat().st_size
+                if entry.name == "data.frame":
+                    size += frame_size(Path(entry.path))
 
-    folders_in_path = list(filter(lambda x: x.is_dir(), list(path.iterdir())))
-    # create the file properties node
-    file_properties = FileProperty()
-    file_properties.size = folder_size
-    file_properties.n_childs = len(folders_in_path)
+    if (path / ".meta.json").samefile(top_level_meta.path):
+        meta = top_level_meta
+    else:
+        meta = Meta.from_json(path / ".meta.json", top_level_meta)
+    meta.update_file_properties(size=size, n_childs=n_childs)
+    if meta.is_dirty:
+        meta.write()
 
-    meta.add_property(file_properties)
+    return size
 
-    return folder_size
 
+def get_data_size(path: Path) -> int:
+    """
+    Size of the data in the leafs below the path, the metas are not included
+    """
+    size = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == ".pack":
+                size += sum(packed["length"] for packed in packed_index(Path(entry.path)).values())
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                size += get_data_size(Path(entry.path))
+            else:
+                size += entry.stat().st_size
+                if entry.name == "data.frame":
+                    size += frame_size(Path(entry.path))
+    return size
+
+
+def packed_index(path: Path) -> dict:
+    """
+    The index of the pack of small leafs at path
+    """
+    from science_data_structure.data_formats.packed_formats import Pack
+    return Pack.read_index(path)
+
+
+def frame_size(path: Path) -> int:
+    """
+    Size of the column chunks of the DataFrame leaf described at path
+    """
+    return sum(json.loads(path.read_text())["files"].values())
@@ -4,7 +4,8 @@ from science_data_structure.meta import Meta
 from science_data_structure.config import ConfigManager
 from science_data_structure.tools import files as file_tools
 from pathlib import Path
-from science_data_structure.structures import StructuredDataSet
+from science_data_structure.structures import Branch, StructuredDataSet
+from science_data_structure.stats import IOStats
 import os
 
 
@@ -36,6 +37,10 @@ def global_list():
 def _list():
     pass
 
+@click.group(name="catalog")
+def _catalog():
+    pass
+
 @click.command(name="dataset")
 @click.argument("name")
 @click.argument("description", required=False)
@@ -55,19 +60,57 @@ def create_dataset(name,
     dataset.write()
 
 
+def current_meta() -> Meta:
+    """
+    The meta of the node in the current directory, the author ids of a
+    node are resolved against the top level meta of its data-set
+    """
+    top_level_meta = file_tools.find_top_level_meta(Path(os.getcwd()))
+    if top_level_meta.path.parent.samefile(os.getcwd()):
+        return top_level_meta
+    return Meta.from_json(Path(os.getcwd()) / ".meta.json", top_level_meta)
+
 @click.command(name="meta")
 def list_meta():
-    meta = Meta.from_json(Path(os.getcwd()) / ".meta.json")
-    click.echo(str(meta))
+    click.echo(str(current_meta()))
 
 @click.command(name="author")
 def list_author():
-    meta = Meta.from_json(Path(os.getcwd()) / ".meta.json")
+    meta = current_meta()
     authors = meta.authors
     authors = list(map(lambda x: str(x), authors))
     for author in authors:
         click.echo(author)
 
+@click.command(name="rebuild")
+def rebuild_catalog():
+    dataset = StructuredDataSet.open_dataset(Path(os.getcwd()), use_catalog=False)
+    catalog = dataset.create_catalog()
+    click.echo(catalog.path)
+
+@click.command(name="consolidate")
+def consolidate_dataset():
+    dataset = StructuredDataSet.open_dataset(Path(os.getcwd()), use_consolidated=False)
+    click.echo(dataset.consolidate())
+
+@click.command(name="stats")
+@click.option("--data", is_flag=True, help="read the data of all the leafs as well")
+@click.option("--nodes", default=10, help="number of slowest nodes to list")
+def report_stats(data, nodes):
+    stats = IOStats()
+    dataset = StructuredDataSet.open_dataset(Path(os.getcwd()), stats=stats)
+    if data:
+        branches = [dataset]
+        while len(branches) > 0:
+            branch = branches.pop()
+            for key in branch.keys():
+                node = branch[key]
+                if isinstance(node, Branch):
+                    branches += [node]
+                else:
+                    node.data
+    click.echo(stats.report(nodes))
+
 @click.command(name="author")
 @click.argument("name", required=False)
 def create_global_author(name):
@@ -107,6 +150,12 @@ manage.add_command(_list)
 
 # edit group
 manage.add_command(edit)
+manage.add_command(consolidate_dataset)
+manage.add_command(report_stats)
+
+# catalog group
+_catalog.add_command(rebuild_catalog)
+manage.add_command(_catalog)
 
 
 if __name__ == "__main__":
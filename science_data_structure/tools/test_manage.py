@@ -1,6 +1,11 @@
+import os
+import shutil
 import unittest
+import numpy
 from tools import manage
 from meta import Meta
+from author import Author
+from structures import StructuredDataSet
 from click.testing import CliRunner
 from pathlib import Path
 
@@ -17,6 +22,23 @@ class TestManage(unittest.TestCase):
         result = runner.invoke(manage.create_dataset, ["test_data_set"])
         print(result.output)
 
+    def test_list_branch_authors(self):
+        path = Path("../test_manage")
+        path.mkdir(exist_ok=True)
+        shutil.rmtree(path / "authors.struct", ignore_errors=True)
+        dataset = StructuredDataSet.create_dataset(path, "authors", Author.create_author("Test Author"))
+        dataset["a"]["x"] = numpy.arange(3)
+        dataset["a"].meta.add_author(Author.create_author("Branch Author"))
+        dataset.write()
+        cwd = os.getcwd()
+        os.chdir(dataset["a"].path)
+        try:
+            result = CliRunner().invoke(manage.list_author)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Branch Author", result.output)
+
     def test_list_authors(self):
         path = Path("../../test_new.struct/.meta.json")
 
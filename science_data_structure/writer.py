@@ -0,0 +1,394 @@
+from concurrent.futures import Executor, Future, wait
+from pathlib import Path
+from typing import Callable, List, Set, Tuple
+import json
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Writer:
+    """
+    Carries out the disk operations of a single write of the tree. Directories
+    are created and nodes are removed in the order of the walk through the
+    tree, writing files can be handed to an executor
+    """
+
+    def __init__(self,
+                 executor: Executor = None) -> None:
+        self._executor = executor
+        self._futures = []  # type: List[Future]
+        self._written = []  # type: list
+        self._deferred = []  # type: list
+        self._removed = []  # type: List[Path]
+
+    @property
+    def written(self) -> list:
+        """
+        The nodes written so far
+        """
+        return self._written
+
+    @property
+    def removed(self) -> List[Path]:
+        """
+        The paths of the nodes removed so far
+        """
+        return self._removed
+
+    def makedirs(self, path: Path) -> None:
+        os.makedirs(path, exist_ok=True)
+
+    def target(self, path: Path) -> Path:
+        """
+        The path to write the file at path to
+        """
+        return path
+
+    def in_place(self, path: Path, header_size: int = 0) -> Path:
+        """
+        The file at path is changed in place instead of written as a whole,
+        data is only added at the end and the first header_size bytes are
+        rewritten
+        """
+        return path
+
+    def write_text(self, path: Path, text: str) -> None:
+        self.submit(path.write_text, text)
+
+    def remove(self, node) -> None:
+        self._removed += [node.path]
+        node.remove()
+
+    def node_written(self, node) -> None:
+        self._written += [node]
+
+    def defer(self, function: Callable, *args) -> None:
+        """
+        Call the function once all the writes submitted before finish are
+        done, deferred functions are called in the order they are added
+        """
+        self._deferred += [(function, args)]
+
+    def submit(self, function: Callable, *args) -> None:
+        if self._executor is None:
+            function(*args)
+        else:
+            self._futures += [self._executor.submit(function, *args)]
+
+    def finish(self) -> None:
+        """
+        Wait until all the submitted writes and deferred functions are done,
+        the first error is raised
+        """
+        self._wait()
+        while len(self._deferred) > 0:
+            deferred = self._deferred
+            self._deferred = []
+            for function, args in deferred:
+                function(*args)
+            self._wait()
+
+    def abort(self) -> None:
+        """
+        Stop after a failed write, waits for the writes still running
+        """
+        futures = self._futures
+        self._futures = []
+        wait(futures)
+        self._deferred = []
+
+    # protected functions
+    def _wait(self) -> None:
+        futures = self._futures
+        self._futures = []
+        wait(futures)
+        for future in futures:
+            future.result()
+
+
+class TransactionalWriter(Writer):
+    """
+    Writer that stages all the changes before committing them. Files are
+    written next to their destination as hidden temporary files and removed
+    nodes are moved aside. Files changed in place, like appended arrays,
+    keep their old length and header to restore them. On finish the staged
+    and changed files are flushed to disk, the temporary files are renamed
+    to their destination and only the changed directories are synced. A
+    failed write is rolled back. With a journal, a write interrupted by a
+    crash is finished or undone by recover, after which every file is either
+    its old or its new version. The writer holds a lock on the journal until
+    it is done, a write that is still running is left alone by recover.
+    Without fcntl, on Windows, the journal is not locked
+    """
+
+    journal_name = ".transaction.jsonl"
+
+    def __init__(self,
+                 executor: Executor = None,
+                 journal: Path = None) -> None:
+        super().__init__(executor)
+        self._staged = []  # type: List[Tuple[Path, Path]]
+        self._in_place = []  # type: List[Tuple[Path, int, bytes]]
+        self._trash = []  # type: List[Tuple[Path, Path]]
+        self._created = []  # type: List[Path]
+        self._directories = set()  # type: Set[Path]
+        self._journal = journal
+        self._journal_file = None
+        if journal is not None:
+            # the first write of a data-set creates its folder
+            self.makedirs(journal.parent)
+            while True:
+                journal_file = journal.open("a")
+                if TransactionalWriter._lock(journal_file, journal, blocking=True):
+                    break
+                journal_file.close()
+            # the journal of a write that crashed before, and was never recovered, is replaced
+            journal_file.truncate(0)
+            self._journal_file = journal_file
+            self._log({"state": "pending"})
+
+    def makedirs(self, path: Path) -> None:
+        if not path.is_dir():
+            created = path
+            while not created.parent.is_dir():
+                created = created.parent
+            os.makedirs(path, exist_ok=True)
+            self._created += [created]
+            self._directories.add(created.parent)
+
+    def target(self, path: Path) -> Path:
+        path_tmp = path.with_name(".{:s}.tmp".format(path.name))
+        self._staged += [(path_tmp, path)]
+        return path_tmp
+
+    def in_place(self, path: Path, header_size: int = 0) -> Path:
+        length = path.stat().st_size if path.exists() else None
+        header = b""
+        if length is not None and header_size > 0:
+            with path.open("rb") as in_place_file:
+                header = in_place_file.read(header_size)
+        self._in_place += [(path, length, header)]
+        self._log({"in_place": self._relative(path), "length": length, "header": header.hex()})
+        return path
+
+    def write_text(self, path: Path, text: str) -> None:
+        self.submit(self.target(path).write_text, text)
+
+    def remove(self, node) -> None:
+        path = node.path
+        path_trash = path.with_name(".{:s}.removed".format(path.name))
+        if path_trash.exists():
+            shutil.rmtree(path_trash)
+        os.replace(path, path_trash)
+        self._trash += [(path, path_trash)]
+        self._directories.add(path.parent)
+        self._removed += [path]
+
+    def finish(self) -> None:
+        try:
+            super().finish()
+        except BaseException:
+            self.abort()
+            raise
+        try:
+            self._commit()
+        except BaseException:
+            # the journal is left to recover, which finishes the commit
+            self._release_journal()
+            raise
+
+    def abort(self) -> None:
+        """
+        Stop after a failed write, the staged files are deleted, the files
+        changed in place are restored and the removed nodes are moved back
+        """
+        super().abort()
+        self._rollback()
+
+    @staticmethod
+    def recover(root: Path) -> bool:
+        """
+        Finish or undo a write below root that was interrupted by a crash,
+        using the journal it left. A write that was committing is finished,
+        any other write is undone. A write that still holds the lock on its
+        journal is running and left alone. Returns True when the write was
+        finished
+        """
+        journal = root / TransactionalWriter.journal_name
+        try:
+            journal_file = journal.open("r")
+        except FileNotFoundError:
+            return False
+        with journal_file:
+            # the lock is held until the journal is removed
+            if not TransactionalWriter._lock(journal_file, journal, blocking=False):
+                return False
+            finished = TransactionalWriter._replay(root, journal_file.read())
+            journal.unlink()
+        return finished
+
+    # protected functions
+    @staticmethod
+    def _replay(root: Path, text: str) -> bool:
+        """
+        Finish or undo the write logged in the text of the journal
+        """
+        entries = []
+        for line in text.splitlines():
+            try:
+                entries += [json.loads(line)]
+            except ValueError:
+                # the last line was cut off by the crash
+                break
+        commits = [entry for entry in entries if entry.get("state") == "commit"]
+        if len(commits) > 0:
+            for path_tmp, path in commits[-1]["staged"]:
+                if (root / path_tmp).exists():
+                    os.replace(root / path_tmp, root / path)
+            for path_trash in commits[-1]["trash"]:
+                shutil.rmtree(root / path_trash, ignore_errors=True)
+        else:
+            for entry in reversed(entries):
+                if "in_place" in entry:
+                    TransactionalWriter._restore(root / entry["in_place"], entry["length"],
+                                                 bytes.fromhex(entry["header"]))
+            TransactionalWriter._clean(root)
+        return len(commits) > 0
+
+    def _commit(self) -> None:
+        # flush the data of the changed files only
+        for path in [path_tmp for path_tmp, path in self._staged] + [path for path, *_ in self._in_place]:
+            if path.exists():
+                with path.open("rb+") as staged_file:
+                    os.fsync(staged_file.fileno())
+        self._log({"state": "commit",
+                   "staged": [[self._relative(path_tmp), self._relative(path)] for path_tmp, path in self._staged],
+                   "trash": [self._relative(path_trash) for path, path_trash in self._trash]})
+
+        for path_tmp, path in self._staged:
+            try:
+                os.replace(path_tmp, path)
+            except FileNotFoundError:
+                # nothing was written, the file is unchanged
+                continue
+            self._directories.add(path.parent)
+        self._sync_directories()
+
+        for path, path_trash in self._trash:
+            shutil.rmtree(path_trash)
+        self._close_journal()
+        self._staged = []
+        self._in_place = []
+        self._trash = []
+        self._created = []
+        self._directories = set()
+
+    def _sync_directories(self) -> None:
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        for directory in self._directories:
+            descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def _rollback(self) -> None:
+        for path_tmp, path in self._staged:
+            if path_tmp.exists():
+                path_tmp.unlink()
+        for path, length, header in reversed(self._in_place):
+            TransactionalWriter._restore(path, length, header)
+        for path in reversed(self._created):
+            shutil.rmtree(path, ignore_errors=True)
+        for path, path_trash in reversed(self._trash):
+            if path.exists():
+                shutil.rmtree(path)
+            os.replace(path_trash, path)
+        self._close_journal()
+        self._staged = []
+        self._in_place = []
+        self._trash = []
+        self._created = []
+
+    def _relative(self, path: Path) -> str:
+        if self._journal is None:
+            return str(path)
+        return path.relative_to(self._journal.parent).as_posix()
+
+    def _log(self, entry: dict) -> None:
+        """
+        Add an entry to the journal, it is on disk before the write goes on
+        """
+        if self._journal_file is None:
+            return
+        self._journal_file.write(json.dumps(entry) + "\n")
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def _close_journal(self) -> None:
+        # removed before the lock is released, a waiting recover finds no journal
+        if self._journal_file is not None and self._journal.exists():
+            self._journal.unlink()
+        self._release_journal()
+
+    def _release_journal(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    @staticmethod
+    def _lock(journal_file, journal: Path, blocking: bool) -> bool:
+        """
+        Take the exclusive lock on the open journal, False when another
+        writer holds it or the journal was removed or replaced meanwhile
+        """
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(journal_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        try:
+            return os.stat(journal).st_ino == os.fstat(journal_file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _restore(path: Path, length: int, header: bytes) -> None:
+        if length is None:
+            if path.exists():
+                path.unlink()
+            return
+        if path.exists():
+            with path.open("r+b") as in_place_file:
+                in_place_file.truncate(length)
+                in_place_file.seek(0)
+                in_place_file.write(header)
+
+    @staticmethod
+    def _clean(root: Path) -> None:
+        """
+        Remove what an undone write left below root: the staged files, the
+        removed nodes are moved back and the new, empty, directories deleted
+        """
+        for directory, names, file_names in os.walk(root, topdown=False):
+            directory = Path(directory)
+            for name in file_names:
+                if name.startswith(".") and name.endswith(".tmp"):
+                    (directory / name).unlink()
+            for name in names:
+                path = directory / name
+                if name.startswith(".") and name.endswith(".removed"):
+                    original = directory / name[1:-len(".removed")]
+                    if original.exists():
+                        shutil.rmtree(path)
+                    else:
+                        os.replace(path, original)
+                elif path.is_dir() and not any(path.iterdir()):
+                    path.rmdir()
@@ -16,6 +16,10 @@ setup(
     install_requires=[
         'Click',
     ],
+    extras_require={
+        'pandas': ['pandas'],
+        'matlab': ['scipy', 'h5py'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",